@@ -0,0 +1,24 @@
+import queue
+
+
+class BufferPool:
+    # Pool bytearray ukuran tetap untuk baca/tulis file, dipakai ulang antar transfer
+    def __init__(self, size: int, count: int = 16):
+        # Alokasikan slab di awal
+        self.size = size
+        self._free = queue.SimpleQueue()
+        for _ in range(count):
+            self._free.put(bytearray(size))
+
+    def acquire(self) -> bytearray:
+        # Ambil slab kosong, buat baru kalau pool sedang habis
+        try:
+            return self._free.get_nowait()
+        except queue.Empty:
+            return bytearray(self.size)
+
+    def release(self, buf: bytearray):
+        # Kembalikan slab ke pool
+        if len(buf) == self.size:
+            self._free.put(buf)
+
@@ -1,11 +1,65 @@
 import os
 import base64
+import platform
 from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey, X25519PublicKey
 from cryptography.hazmat.primitives import serialization
-from cryptography.hazmat.primitives.ciphers.aead import ChaCha20Poly1305
+from typing import Iterable, Iterator, Optional
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+
+# decrypt_into hanya ada di versi cryptography yang baru
+_HAS_DECRYPT_INTO = all(hasattr(cls, 'decrypt_into') for cls in (AESGCM, ChaCha20Poly1305))
+
+# Panjang tag AEAD (ChaCha20-Poly1305 dan AES-GCM sama), ciphertext = plaintext + tag
+AEAD_TAG_SIZE = 16
+
+# Nama AEAD yang dikirim saat handshake, ChaCha20-Poly1305 jadi default kalau peer tidak menyebutkan
+AEAD_CHACHA = 'chacha20-poly1305'
+AEAD_AESGCM = 'aes-gcm'
+_AEAD_CLASSES = {AEAD_CHACHA: ChaCha20Poly1305, AEAD_AESGCM: AESGCM}
+
+def has_aesni() -> bool:
+    # Cek instruksi AES di CPU dari /proc/cpuinfo (Linux/Android), selain itu tebak dari arsitektur
+    try:
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                if line.startswith(('flags', 'Features')):
+                    return 'aes' in line.split(':', 1)[1].split()
+    except OSError:
+        pass
+    return platform.machine().lower() in ('x86_64', 'amd64', 'arm64')
+
+class FileEncryptor:
+    # Enkripsi file bertahap: update() per chunk, finalize() untuk chunk terakhir
+    def __init__(self, cipher, prefix: bytes):
+        self._cipher = cipher
+        self._prefix = prefix
+        self._index = 0
+        self._pending = None
+        self.nonce = base64.b64encode(prefix).decode('utf-8')
+
+    def update(self, chunk: bytes) -> Optional[bytes]:
+        # Chunk ditahan satu langkah karena flag chunk terakhir baru diketahui di finalize()
+        previous, self._pending = self._pending, chunk
+        if previous is None:
+            return None
+        return self._seal(previous, b'\x00')
+
+    def finalize(self) -> bytes:
+        # Enkripsi chunk yang tersisa sebagai chunk terakhir (file kosong tetap jadi satu chunk)
+        last = self._pending if self._pending is not None else b''
+        self._pending = None
+        return self._seal(last, b'\x01')
+
+    def _seal(self, chunk: bytes, flag: bytes) -> bytes:
+        # Nonce tiap chunk = prefix(7) + counter(4) + flag chunk terakhir(1), supaya urutan dan pemotongan ketahuan
+        nonce = self._prefix + self._index.to_bytes(4, 'big') + flag
+        self._index += 1
+        return self._cipher.encrypt(nonce, chunk, None)
+
 
 class CryptoManager:
-    # Mengelola enkripsi dan dekripsi dengan key X25519 dan eknrip dekrip ChaCha20-Poly1305
+    # Mengelola enkripsi dan dekripsi dengan key X25519 dan eknrip dekrip ChaCha20-Poly1305 / AES-GCM
     def __init__(self):
         # Generate X25519 key pair
         self.private_key = X25519PrivateKey.generate()
@@ -13,6 +67,11 @@ class CryptoManager:
         self.peer_public_keys = {}  
         self.shared_keys = {}  
         self.group_keys = {}  
+        # Objek AEAD dibuat sekali per key lalu dipakai ulang
+        self._peer_ciphers = {}
+        self._group_ciphers = {}
+        # AES-GCM hanya lebih cepat kalau CPU punya AES-NI, di HP tanpa itu ChaCha20 jauh lebih cepat
+        self.aead_alg = AEAD_AESGCM if has_aesni() else AEAD_CHACHA
         
     def get_public_key_bytes(self) -> bytes:
         # Mendapatkan public key dalam format raw bytes untuk dikirim ke peer
@@ -25,7 +84,13 @@ class CryptoManager:
         # Mengubah bentuk bytes ke base64
         return base64.b64encode(self.get_public_key_bytes())
         
-    def import_peer_public_key(self, peer_id: str, key_bytes: bytes):
+    def common_aead(self, peer_algs: Iterable[Optional[str]]) -> str:
+        # AES-GCM hanya dipakai kalau kita dan semua peer memilihnya, selain itu ChaCha20-Poly1305
+        if self.aead_alg == AEAD_AESGCM and all(alg == AEAD_AESGCM for alg in peer_algs):
+            return AEAD_AESGCM
+        return AEAD_CHACHA
+
+    def import_peer_public_key(self, peer_id: str, key_bytes: bytes, peer_aead: Optional[str] = None):
         # Import public key dari peer dan buat shared key
         try:
             if len(key_bytes) != 32:
@@ -38,15 +103,16 @@ class CryptoManager:
 
         shared_key = self.private_key.exchange(peer_public)
         self.shared_keys[peer_id] = shared_key  
+        self._peer_ciphers[peer_id] = _AEAD_CLASSES[self.common_aead([peer_aead])](shared_key)
         
     def encrypt_message(self, message: str, peer_id: str) -> dict:
-        # Enkripsi pesan menggunakan ChaCha20-Poly1305 dengan shared key dari X25519 key exchange
+        # Enkripsi pesan dengan AEAD peer (key dari X25519 key exchange)
         if peer_id not in self.shared_keys:
             raise ValueError(f"Shared key untuk peer {peer_id} tidak ditemukan")
 
         nonce = os.urandom(12)
-        chacha = ChaCha20Poly1305(self.shared_keys[peer_id])
-        ciphertext = chacha.encrypt(nonce, message.encode('utf-8'), None)
+        cipher = self._peer_ciphers[peer_id]
+        ciphertext = cipher.encrypt(nonce, message.encode('utf-8'), None)
         
         return {
             'ciphertext': base64.b64encode(ciphertext).decode('utf-8'),
@@ -54,56 +120,103 @@ class CryptoManager:
         }
     
     def decrypt_message(self, encrypted_data: dict, peer_id: str) -> str:
-        # Dekripsi pesan dari peer tertentu menggunakan ChaCha20-Poly1305
+        # Dekripsi pesan dari peer tertentu dengan AEAD peer
         if peer_id not in self.shared_keys:
             raise ValueError(f"Shared key untuk peer {peer_id} tidak ditemukan")
         
         ciphertext = base64.b64decode(encrypted_data['ciphertext'])
         nonce = base64.b64decode(encrypted_data['nonce'])
-        chacha = ChaCha20Poly1305(self.shared_keys[peer_id])
-        plaintext = chacha.decrypt(nonce, ciphertext, None)
+        cipher = self._peer_ciphers[peer_id]
+        plaintext = cipher.decrypt(nonce, ciphertext, None)
         
         return plaintext.decode('utf-8')
     
-    def encrypt_file(self, file_data: bytes, peer_id: str) -> dict:
-        # Enkripsi file menggunakan ChaCha20-Poly1305
+    def start_stream_encrypt(self, peer_id: str) -> FileEncryptor:
+        # Mulai enkripsi file bertahap untuk peer, nonce prefix acak per file
         if peer_id not in self.shared_keys:
             raise ValueError(f"Shared key untuk peer {peer_id} tidak ditemukan")
+        return FileEncryptor(self._peer_ciphers[peer_id], os.urandom(7))
 
-        nonce = os.urandom(12)
-        chacha = ChaCha20Poly1305(self.shared_keys[peer_id])
-        ciphertext = chacha.encrypt(nonce, file_data, None)
-        
+    def encrypt_file(self, chunks: Iterable[bytes], peer_id: str) -> dict:
+        # Enkripsi file per chunk (stream), 'encrypted_file' berisi generator chunk ciphertext mentah
+        encryptor = self.start_stream_encrypt(peer_id)
         return {
-            'encrypted_file': base64.b64encode(ciphertext).decode('utf-8'),
-            'nonce': base64.b64encode(nonce).decode('utf-8')
+            'encrypted_file': self._seal_chunks(encryptor, chunks),
+            'nonce': encryptor.nonce
         }
+
+    def _seal_chunks(self, encryptor: FileEncryptor, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        # Generator di atas FileEncryptor
+        for chunk in chunks:
+            ciphertext = encryptor.update(chunk)
+            if ciphertext is not None:
+                yield ciphertext
+        yield encryptor.finalize()
     
-    def decrypt_file(self, encrypted_data: dict, peer_id: str = None) -> bytes:
-        # Dekripsi file
-        ciphertext = base64.b64decode(encrypted_data['encrypted_file'])
-        nonce = base64.b64decode(encrypted_data['nonce'])
+    def decrypt_file(self, encrypted_data: dict, peer_id: str = None, buffer: bytearray = None) -> Iterator[bytes]:
+        # Dekripsi file per chunk, plaintext di-yield satu chunk sekali
+        # Kalau buffer diberikan, plaintext ditulis ke buffer itu dan hanya valid sampai chunk berikutnya
+        prefix = base64.b64decode(encrypted_data['nonce'])
+        chunks = iter(encrypted_data['encrypted_file'])
+        first = self._as_ciphertext(next(chunks, b''))
 
-        if peer_id and peer_id in self.shared_keys:
-            chacha = ChaCha20Poly1305(self.shared_keys[peer_id])
-            return chacha.decrypt(nonce, ciphertext, None)
-        
-        for shared_key in self.shared_keys.values():
+        if peer_id and peer_id in self._peer_ciphers:
+            candidates = [self._peer_ciphers[peer_id]]
+        else:
+            candidates = list(self._peer_ciphers.values())
+
+        # Key yang benar ditentukan dari chunk pertama
+        cipher = None
+        for candidate in candidates:
             try:
-                chacha = ChaCha20Poly1305(shared_key)
-                return chacha.decrypt(nonce, ciphertext, None)
+                plaintext, last = self._open_chunk(candidate, prefix, 0, first, buffer)
+                cipher = candidate
+                break
             except:
                 continue
-        
-        raise ValueError("Gagal mendekripsi file")
+        if cipher is None:
+            raise ValueError("Gagal mendekripsi file")
+        yield plaintext
+
+        index = 1
+        for chunk in chunks:
+            if last:
+                raise ValueError("Gagal mendekripsi file: ada data setelah chunk terakhir")
+            plaintext, last = self._open_chunk(cipher, prefix, index, self._as_ciphertext(chunk), buffer)
+            yield plaintext
+            index += 1
+        if not last:
+            raise ValueError("Gagal mendekripsi file: file terpotong")
+
+    def _as_ciphertext(self, chunk):
+        # Chunk berupa bytes/memoryview, string berarti masih base64 (format lama)
+        return base64.b64decode(chunk) if isinstance(chunk, str) else chunk
+
+    def _open_chunk(self, cipher, prefix: bytes, index: int, ciphertext: bytes, buffer=None):
+        # Dekripsi satu chunk, coba sebagai chunk biasa lalu sebagai chunk terakhir
+        counter = prefix + index.to_bytes(4, 'big')
+        size = len(ciphertext) - AEAD_TAG_SIZE
+        if buffer is not None and _HAS_DECRYPT_INTO and 0 <= size <= len(buffer):
+            out = memoryview(buffer)[:size]
+            try:
+                cipher.decrypt_into(counter + b'\x00', ciphertext, None, out)
+                return out, False
+            except InvalidTag:
+                cipher.decrypt_into(counter + b'\x01', ciphertext, None, out)
+                return out, True
+        try:
+            return cipher.decrypt(counter + b'\x00', ciphertext, None), False
+        except InvalidTag:
+            return cipher.decrypt(counter + b'\x01', ciphertext, None), True
     
-    def create_group_key(self, group_id: str) -> bytes:
-        # Generate random 32-byte key untuk group chat dan diubah ke base64
+    def create_group_key(self, group_id: str, aead: str = AEAD_CHACHA) -> bytes:
+        # Generate random 32-byte key untuk group chat, dikirim mentah ke member
         key = os.urandom(32) 
         self.group_keys[group_id] = key
-        return base64.b64encode(key)
+        self._group_ciphers[group_id] = _AEAD_CLASSES[aead](key)
+        return key
     
-    def set_group_key(self, group_id: str, key_bytes: bytes):
+    def set_group_key(self, group_id: str, key_bytes: bytes, aead: Optional[str] = None):
         # Import group key dari creator grup
         try:
             if len(key_bytes) != 32:
@@ -111,6 +224,7 @@ class CryptoManager:
         except:
             pass
         self.group_keys[group_id] = key_bytes
+        self._group_ciphers[group_id] = _AEAD_CLASSES.get(aead, ChaCha20Poly1305)(key_bytes)
     
     def get_group_key(self, group_id: str) -> bytes:
         # Get group key 
@@ -123,13 +237,13 @@ class CryptoManager:
         return group_id in self.group_keys
     
     def encrypt_group_message(self, message: str, group_id: str) -> dict:
-        # Enkripsi pesan group menggunakan ChaCha20-Poly1305 dengan shared group key
+        # Enkripsi pesan group dengan AEAD dari shared group key
         if group_id not in self.group_keys:
             raise ValueError(f"Group key untuk {group_id} tidak ditemukan")
         
         nonce = os.urandom(12)
-        chacha = ChaCha20Poly1305(self.group_keys[group_id])
-        ciphertext = chacha.encrypt(nonce, message.encode('utf-8'), None)
+        cipher = self._group_ciphers[group_id]
+        ciphertext = cipher.encrypt(nonce, message.encode('utf-8'), None)
         
         return {
             'ciphertext': base64.b64encode(ciphertext).decode('utf-8'),
@@ -138,14 +252,14 @@ class CryptoManager:
         }
     
     def decrypt_group_message(self, encrypted_data: dict, group_id: str) -> str:
-        # Dekripsi pesan group menggunakan ChaCha20-Poly1305
+        # Dekripsi pesan group dengan AEAD dari shared group key
         if group_id not in self.group_keys:
             raise ValueError(f"Group key untuk {group_id} tidak ditemukan")
         
         ciphertext = base64.b64decode(encrypted_data['ciphertext'])
         nonce = base64.b64decode(encrypted_data['nonce'])
-        chacha = ChaCha20Poly1305(self.group_keys[group_id])
-        plaintext = chacha.decrypt(nonce, ciphertext, None)
+        cipher = self._group_ciphers[group_id]
+        plaintext = cipher.decrypt(nonce, ciphertext, None)
         
         return plaintext.decode('utf-8')
 
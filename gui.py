@@ -1,7 +1,14 @@
 import customtkinter as ctr
+import tkinter as tk
 from tkinter import filedialog, messagebox, simpledialog
-import os
-from datetime import datetime
+from tkinter import font as tkfont
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import deque, namedtuple
+from dataclasses import dataclass
+from functools import partial
+from itertools import islice
 from typing import Callable, Optional
 from network import get_local_ip
 
@@ -9,6 +16,34 @@ from network import get_local_ip
 ctr.set_appearance_mode("dark")
 ctr.set_default_color_theme("dark-blue")
 
+_SUFFIX = ('B', 'KB', 'MB', 'GB', 'TB')
+
+def _fmtsize(n: int) -> str:
+    # Format ukuran file, satuan dipilih dari bit_length (tiap 10 bit = 1024x)
+    if n < 1024:
+        return f"{n} B"
+    i = min((n.bit_length() - 1) // 10, len(_SUFFIX) - 1)
+    return f"{n / (1 << (i * 10)):.1f} {_SUFFIX[i]}"
+
+@dataclass
+class Msg:
+    # Record satu pesan di chat history, pakai __slots__ supaya ringan di chat panjang
+    __slots__ = ('ts', 'sender', 'msg', 'is_sent', 'type', 'info', 'file_id', 'height', 'meta')
+    ts: str
+    sender: str
+    msg: str
+    is_sent: bool
+    type: str
+    info: str
+    file_id: Optional[int]   # Terisi untuk file yang bisa didownload
+    height: int              # Tinggi baris di canvas (px), 0 = belum diestimasi
+    meta: Optional[dict]     # Data terstruktur (file: filename + size), teks tampilan disusun saat render
+
+
+# Widget satu baris chat di canvas (item = id window di canvas), dipakai ulang untuk record yang berbeda
+BubbleWidgets = namedtuple('BubbleWidgets', ('kind', 'item', 'frame', 'body', 'info', 'button', 'path'))
+
+
 class ChatGUI:
     # GUI dengan customTKinter
     COLORS = {
@@ -26,6 +61,45 @@ class ChatGUI:
         'message_sent': '#005c4b',      
         'message_received': '#202c33',  
     }
+    # Warna yang sering dipakai di jalur render, dibaca langsung tanpa lookup dict
+    ACCENT = COLORS['accent']
+    GROUP = COLORS['group']
+    TEXT = COLORS['text']
+    TEXT_MUTED = COLORS['text_muted']
+    MESSAGE_SENT = COLORS['message_sent']
+    MESSAGE_RECEIVED = COLORS['message_received']
+
+    # Kwargs widget bubble yang konstan, disusun sekali di level class
+    _TRANSPARENT_KW = {'fg_color': 'transparent'}
+    _SENT_BUBBLE_KW = {'fg_color': COLORS['message_sent'], 'corner_radius': 12}
+    _RCV_BUBBLE_KW = {'fg_color': COLORS['message_received'], 'corner_radius': 12}
+    _MSG_BODY_KW = {'wrap': 'word', 'fg': COLORS['text'], 'relief': 'flat', 'borderwidth': 0,
+                    'highlightthickness': 0, 'padx': 0, 'pady': 0, 'cursor': 'arrow'}
+    _INFO_LABEL_KW = {'text_color': COLORS['text_muted']}
+
+    IP_PLACEHOLDER = "Detecting…"
+    FILE_PENDING, FILE_SAVING, FILE_SAVED, FILE_EXPIRED = range(4)
+    UI_TICK_MS = 16       # Interval pump antrian UI (~60Hz)
+    UI_BATCH = 64         # Maksimal callback yang dijalankan per tick
+    PROGRESS_INTERVAL = 0.05  # Jeda minimal antar update progress bar (detik)
+    TOAST_MS = 3000       # Lama toast error/info tampil
+    HISTORY_LIMIT = 500   # Maksimal pesan yang disimpan per chat
+    BUBBLE_WRAP = 350     # Lebar maksimal isi bubble (px)
+    ROW_GAP = 10          # Jarak antar baris chat (px)
+    WHEEL_STEP = 3        # Jumlah unit scroll per putaran mouse wheel
+    AUTOSCROLL_DELAY_MS = 32
+
+    # Estimasi tinggi baris sebelum diukur: padding bubble + label info, tombol download, pesan sistem
+    BUBBLE_EXTRA_HEIGHT = 46
+    DOWNLOAD_EXTRA_HEIGHT = 36
+    SYSTEM_ROW_HEIGHT = 34
+    # Jumlah baris per jenis yang dibangun di awal untuk pool
+    POOL_PREBUILD = {'sent': 8, 'received': 8, 'system': 4}
+
+    # Font isi bubble dibuat sekali dan dipakai bersama semua bubble
+    _body_font = None
+    _body_char_width = 1
+    _body_linespace = 18
     
     def __init__(self):
         self.root = ctr.CTk()
@@ -47,17 +121,53 @@ class ChatGUI:
         self.current_is_group: bool = False
         self.peers: dict = {}
         self.groups: dict = {}
-        self.pending_files: dict = {}
+        # File yang bisa didownload, list paralel dengan index = file_id
+        self._pf_filename: list = []
+        self._pf_state: list = []    # FILE_PENDING / FILE_SAVING / FILE_SAVED / FILE_EXPIRED
+        self._pf_path: list = []     # Lokasi file setelah tersimpan
+        self._btn_callbacks: list = []  # Command tombol download per file_id, None setelah tersimpan
         self.my_username: str = "Me"
         
         # Chat history storage
         self.chat_histories: dict = {}
         
+        # Layout chat yang tampil: y_offsets tiap record + baris yang sedang punya widget
+        self._shown_chat: Optional[str] = None
+        self._row_tops: list = []
+        self._layout_bottom = 0
+        self._canvas_width = 1
+        self._visible_rows: dict = {}  # id(record) -> (record, BubbleWidgets)
+        self._bubble_pool: dict = {'sent': [], 'received': [], 'system': [], 'download': []}
+        self._refresh_scheduled = False
+        self._measure_scheduled = False
+        self._scroll_scheduled = False
+        
+        # Font yang dipakai berulang (bubble, list peer/group) dibuat sekali saja
+        self._font_msg = ctr.CTkFont(size=13)
+        self._font_info = ctr.CTkFont(size=10)
+        self._font_btn = ctr.CTkFont(size=12, weight="bold")
+        self._font_sys = ctr.CTkFont(size=10, slant="italic")
+        
         # Peer/Group button references
         self.peer_buttons: dict = {}
         self.group_buttons: dict = {}
         
+        # Antrian update dari thread network, dijalankan di UI thread oleh satu pump
+        self._ui_queue: deque = deque()
+        self._pending_progress: dict = {}  # (peer_id, filename) -> progress terakhir
+        self._last_progress_pct = -1
+        self._last_progress_ts = 0.0
+        self._cached_minute = (-1, "")  # (menit epoch, "HH:MM")
+        
+        # Toast error/info, dibuat saat pertama dipakai
+        self._toast_frame = None
+        self._toast_label = None
+        self._toast_after = None
+        
         self._create_widgets()
+        self.root.after(self.UI_TICK_MS, self._drain_ui_queue)
+        self.root.after_idle(self._prebuild_rows)
+        threading.Thread(target=self._set_ip_async, daemon=True).start()
     
     def _create_widgets(self):
         # Buat semua widgets
@@ -118,8 +228,7 @@ class ChatGUI:
                                     border_color=self.COLORS['border'],
                                     text_color=self.COLORS['text'])
         self.ip_entry.pack(fill="x", pady=(2, 4))
-        ip = get_local_ip()
-        self.ip_entry.insert(0, ip)
+        self.ip_entry.insert(0, self.IP_PLACEHOLDER)
         
         # Port Input
         port_label = ctr.CTkLabel(conn_frame, text="Port",
@@ -168,32 +277,57 @@ class ChatGUI:
         self.peers_frame = ctr.CTkFrame(scroll_content, fg_color=self.COLORS['bg_light'],
                                         corner_radius=6)
         self.peers_frame.pack(fill="x", padx=15, pady=(0, 6))
+        self._peer_indicator = ctr.CTkFrame(self.peers_frame, width=3, corner_radius=0,
+                                            fg_color=self.ACCENT)
         
-        # Groups section
-        groups_header = ctr.CTkLabel(scroll_content, text="Groups",
-                                    font=ctr.CTkFont(size=12, weight="bold"),
-                                    text_color=self.COLORS['text'])
-        groups_header.pack(padx=15, anchor="w", pady=(6, 3))
+        # Groups section, header dan list group baru dibuat lewat _ensure_groups_ui
+        self._groups_container = ctr.CTkFrame(scroll_content, fg_color="transparent")
+        self._groups_container.pack(fill="x", padx=15, pady=(6, 12))
         
         # Create group button
-        self.create_group_btn = ctr.CTkButton(scroll_content, text="➕ Create Group",
+        self.create_group_btn = ctr.CTkButton(self._groups_container, text="➕ Create Group",
                                              height=30,
                                              fg_color=self.COLORS['group'],
                                              hover_color="#475569",
                                              font=ctr.CTkFont(size=11, weight="bold"),
                                              command=self._on_create_group_click)
-        self.create_group_btn.pack(fill="x", padx=15, pady=(0, 4))
+        self.create_group_btn.pack(fill="x", pady=(0, 4))
+        self.groups_frame = None
+        self._group_indicator = None
+    
+    def _set_ip_async(self):
+        # Deteksi IP lokal di thread terpisah supaya window tidak tertahan
+        ip = get_local_ip()
+        self.post(lambda: self._fill_ip_entry(ip))
+    
+    def _fill_ip_entry(self, ip: str):
+        # Isi IP hasil deteksi, kecuali user sudah mengetik sendiri
+        if self.ip_entry.get() == self.IP_PLACEHOLDER:
+            self.ip_entry.delete(0, "end")
+            self.ip_entry.insert(0, ip)
+    
+    def _ensure_groups_ui(self):
+        # Buat header dan frame list group saat group pertama muncul
+        if self.groups_frame is not None:
+            return
+        
+        groups_header = ctr.CTkLabel(self._groups_container, text="Groups",
+                                    font=ctr.CTkFont(size=12, weight="bold"),
+                                    text_color=self.COLORS['text'])
+        groups_header.pack(anchor="w", pady=(0, 3), before=self.create_group_btn)
         
-        # Groups frame 
-        self.groups_frame = ctr.CTkFrame(scroll_content, fg_color=self.COLORS['bg_light'],
+        self.groups_frame = ctr.CTkFrame(self._groups_container, fg_color=self.COLORS['bg_light'],
                                          corner_radius=6)
-        self.groups_frame.pack(fill="x", padx=15, pady=(0, 12))
+        self.groups_frame.pack(fill="x")
+        self._group_indicator = ctr.CTkFrame(self.groups_frame, width=3, corner_radius=0,
+                                             fg_color=self.ACCENT)
     
     def _create_chat_area(self):
         # Chat section 
         chat_container = ctr.CTkFrame(self.root, corner_radius=0,
                                      fg_color=self.COLORS['bg_dark'])
         chat_container.grid(row=0, column=1, sticky="nswe")
+        self._chat_container = chat_container
         chat_container.grid_columnconfigure(0, weight=1)
         chat_container.grid_rowconfigure(1, weight=1)
         
@@ -227,24 +361,25 @@ class ChatGUI:
                                               text_color=self.COLORS['text'])
         self.my_username_label.pack(anchor="e")
         
-        # Chat messages area
-        self.chat_frame = ctr.CTkScrollableFrame(
-            chat_container,
-            fg_color=self.COLORS['bg_dark'],
-            corner_radius=0
-        )
-        self.chat_frame.grid(row=1, column=0, sticky="nswe", padx=10, pady=(10, 0))
+        # Chat messages area, canvas biasa supaya hanya baris yang kelihatan yang punya widget
+        chat_area = ctr.CTkFrame(chat_container, fg_color=self.COLORS['bg_dark'], corner_radius=0)
+        chat_area.grid(row=1, column=0, sticky="nswe", padx=10, pady=(10, 0))
+        chat_area.grid_columnconfigure(0, weight=1)
+        chat_area.grid_rowconfigure(0, weight=1)
 
-        # Progress bar
-        self.progress_frame = ctr.CTkFrame(chat_container, fg_color="transparent")
-        self.progress_label = ctr.CTkLabel(self.progress_frame, text="",
-                                          font=ctr.CTkFont(size=11),
-                                          text_color=self.COLORS['text_muted'])
-        self.progress_label.pack(anchor="w", padx=10)
-        self.progress_bar = ctr.CTkProgressBar(self.progress_frame, 
-                                               progress_color=self.COLORS['accent'])
-        self.progress_bar.pack(fill="x", padx=10, pady=5)
-        self.progress_bar.set(0)
+        self.chat_canvas = ctr.CTkCanvas(chat_area, bg=self.COLORS['bg_dark'],
+                                         highlightthickness=0, yscrollincrement=20)
+        self.chat_canvas.grid(row=0, column=0, sticky="nswe")
+        self.chat_scrollbar = ctr.CTkScrollbar(chat_area, command=self.chat_canvas.yview)
+        self.chat_scrollbar.grid(row=0, column=1, sticky="ns")
+
+        self.chat_canvas.configure(yscrollcommand=self._on_chat_yscroll)
+        self.chat_canvas.bind("<Configure>", self._on_chat_configure)
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.root.bind_all(sequence, self._on_chat_wheel, add="+")
+
+        # Progress bar dibuat lewat _ensure_progress_ui saat transfer pertama
+        self.progress_frame = None
         
         # Input area
         input_frame = ctr.CTkFrame(chat_container, height=70, corner_radius=0,
@@ -279,6 +414,21 @@ class ChatGUI:
                                      command=self._on_send_click)
         self.send_btn.grid(row=0, column=2, padx=(10, 15), pady=12)
     
+    def _ensure_progress_ui(self):
+        # Buat progress bar transfer file saat pertama kali dibutuhkan
+        if self.progress_frame is not None:
+            return
+        
+        self.progress_frame = ctr.CTkFrame(self._chat_container, fg_color="transparent")
+        self.progress_label = ctr.CTkLabel(self.progress_frame, text="",
+                                          font=ctr.CTkFont(size=11),
+                                          text_color=self.COLORS['text_muted'])
+        self.progress_label.pack(anchor="w", padx=10)
+        self.progress_bar = ctr.CTkProgressBar(self.progress_frame, 
+                                               progress_color=self.COLORS['accent'])
+        self.progress_bar.pack(fill="x", padx=10, pady=5)
+        self.progress_bar.set(0)
+    
     def _on_connect_click(self):
         # Handle klik tombol connect
         ip = self.ip_entry.get().strip()
@@ -303,16 +453,14 @@ class ChatGUI:
         if not message:
             return
         
-        if not self.current_peer:
+        chat_id = self.current_peer
+        if not chat_id:
             messagebox.showwarning("Warning", "Pilih peer atau group terlebih dahulu!")
             return
         
-        if self.current_is_group:
-            if self.on_send_group_message:
-                self.on_send_group_message(self.current_peer, message)
-        else:
-            if self.on_send_message:
-                self.on_send_message(self.current_peer, message)
+        callback = self.on_send_group_message if self.current_is_group else self.on_send_message
+        if callback:
+            callback(chat_id, message)
         
         self.message_entry.delete(0, "end")
     
@@ -337,18 +485,20 @@ class ChatGUI:
         self._update_selected_states(group_id, is_group=True)
     
     def _update_selected_states(self, selected_id: str, is_group: bool):
-        # Update visual state peer/group button
-        for pid, btn in self.peer_buttons.items():
-            if pid == selected_id and not is_group:
-                btn.configure(fg_color=self.COLORS['accent'])
-            else:
-                btn.configure(fg_color="transparent")
-
-        for gid, btn in self.group_buttons.items():
-            if gid == selected_id and is_group:
-                btn.configure(fg_color=self.COLORS['group'])
-            else:
-                btn.configure(fg_color="transparent")
+        # Update visual state peer/group button, cukup pindahkan indikator tanpa configure button
+        self._place_indicator(self._peer_indicator,
+                              None if is_group else self.peer_buttons.get(selected_id))
+        if self._group_indicator is not None:
+            self._place_indicator(self._group_indicator,
+                                  self.group_buttons.get(selected_id) if is_group else None)
+    
+    def _place_indicator(self, indicator, btn):
+        # Tempel indikator seleksi di sisi kiri button, atau sembunyikan kalau tidak ada
+        if btn is None:
+            indicator.place_forget()
+        else:
+            indicator.place(in_=btn, x=0, y=0, relheight=1)
+            indicator.lift(btn)
     
     def _on_create_group_click(self):
         # Handle create group button
@@ -419,40 +569,343 @@ class ChatGUI:
         self._load_chat_history(chat_id)
     
     def _load_chat_history(self, chat_id: str):
-        # Load dan display chat history
-        for widget in self.chat_frame.winfo_children():
-            widget.destroy()
-        
-        if chat_id in self.chat_histories:
-            for item in self.chat_histories[chat_id]:
-                timestamp, sender, message, is_sent, msg_type = item
-                
-                if msg_type == 'message':
-                    if is_sent:
-                        self._add_sent_bubble(sender, message, timestamp)
-                    else:
-                        self._add_received_bubble(sender, message, timestamp)
-                
-                elif msg_type == 'system':
-                    sys_frame = ctr.CTkFrame(self.chat_frame, fg_color="transparent")
-                    sys_frame.pack(fill="x", pady=8)
-                    
-                    ctr.CTkLabel(
-                        sys_frame,
-                        text=f"--- {message} ---",
-                        font=ctr.CTkFont(size=10, slant="italic"),
-                        text_color=self.COLORS['text_muted']
-                    ).pack()
-                
-                elif msg_type == 'file':
-                    pass 
-
-    def _store_message(self, chat_id: str, sender: str, message: str, is_sent: bool, msg_type: str = 'message'):
-        # Store message ke chat history
-        if chat_id not in self.chat_histories:
-            self.chat_histories[chat_id] = []
-        timestamp = datetime.now().strftime("%H:%M")
-        self.chat_histories[chat_id].append((timestamp, sender, message, is_sent, msg_type))
+        # Tampilkan history chat_id, hanya record yang masuk viewport yang dapat widget
+        for _, widgets in self._visible_rows.values():
+            self._release_row(widgets)
+        self._visible_rows.clear()
+        self._shown_chat = chat_id
+        self._relayout()
+        self._scroll_to_bottom()
+
+    def _relayout(self):
+        # Hitung ulang y_offsets (prefix sum tinggi record) chat yang tampil
+        tops = self._row_tops = []
+        y = 0
+        estimate = self._estimate_height
+        for record in self.chat_histories.get(self._shown_chat, ()):
+            tops.append(y)
+            y += record.height or estimate(record)
+        self._layout_bottom = y
+        self._update_scrollregion()
+
+    def _append_row(self, record: Msg, evicted: Optional[Msg]):
+        # Tambah satu record di ujung layout, record terlama ikut dibuang kalau history penuh
+        if evicted is not None:
+            del self._row_tops[0]
+            entry = self._visible_rows.pop(id(evicted), None)
+            if entry is not None:
+                self._release_row(entry[1])
+        self._row_tops.append(self._layout_bottom)
+        self._layout_bottom += self._estimate_height(record)
+        self._update_scrollregion()
+
+    def _update_scrollregion(self):
+        # Scrollregion canvas = rentang y_offsets chat yang tampil
+        top = self._row_tops[0] if self._row_tops else 0
+        self.chat_canvas.configure(scrollregion=(0, top, self._canvas_width, self._layout_bottom))
+
+    def _scroll_to_bottom(self):
+        # Scroll ke pesan terbaru, viewport dirender ulang sekali saat idle
+        self.chat_canvas.yview_moveto(1.0)
+        self._schedule_refresh()
+
+    def _schedule_autoscroll(self):
+        # Pesan yang masuk beruntun cukup di-scroll sekali per frame
+        if not self._scroll_scheduled:
+            self._scroll_scheduled = True
+            self.root.after(self.AUTOSCROLL_DELAY_MS, self._do_autoscroll)
+
+    def _do_autoscroll(self):
+        # Jalankan auto-scroll yang sudah dijadwalkan
+        self._scroll_scheduled = False
+        self._scroll_to_bottom()
+
+    def _get_body_font(self) -> tkfont.Font:
+        # Font isi bubble dibuat sekali dan dipakai bersama semua bubble
+        font = ChatGUI._body_font
+        if font is None:
+            font = ChatGUI._body_font = tkfont.Font(root=self.root, size=13)
+            ChatGUI._body_char_width = font.measure("0") or 1
+            ChatGUI._body_linespace = font.metrics("linespace")
+        return font
+
+    def _measure_text(self, text: str):
+        # Lebar (dalam karakter) dan jumlah baris isi bubble dari metric font yang di-cache
+        font = self._get_body_font()
+        widest = 0
+        lines = 0
+        for paragraph in text.split("\n"):
+            width = font.measure(paragraph)
+            widest = max(widest, width)
+            lines += max(1, -(-width // self.BUBBLE_WRAP))
+        return max(1, -(-min(widest, self.BUBBLE_WRAP) // ChatGUI._body_char_width)), lines
+
+    def _estimate_height(self, record: Msg) -> int:
+        # Estimasi tinggi baris dari metric font, dikoreksi setelah baris benar-benar dirender
+        if record.type == 'system':
+            height = self.SYSTEM_ROW_HEIGHT
+        else:
+            lines = self._measure_text(self._record_text(record))[1]
+            height = lines * ChatGUI._body_linespace + self.BUBBLE_EXTRA_HEIGHT
+            if record.file_id is not None:
+                height += self.DOWNLOAD_EXTRA_HEIGHT
+        height += self.ROW_GAP
+        record.height = height
+        return height
+
+    def _record_text(self, record: Msg) -> str:
+        # Teks isi bubble, untuk record file disusun dari meta baru saat dirender
+        meta = record.meta
+        if meta is None:
+            return record.msg
+        size = meta['size']
+        if size > 0:
+            return f"📁 {meta['filename']} ({_fmtsize(size)})"
+        return f"📁 {meta['filename']}"
+
+    def _row_kind(self, record: Msg) -> str:
+        # Jenis baris (pool) yang dipakai untuk merender record
+        if record.type == 'system':
+            return 'system'
+        if record.file_id is not None:
+            return 'download'
+        return 'sent' if record.is_sent else 'received'
+
+    def _build_row(self, kind: str) -> BubbleWidgets:
+        # Bangun widget satu baris sekali saja, selanjutnya dipakai ulang lewat pool
+        canvas = self.chat_canvas
+        frame = ctr.CTkFrame(canvas, **self._TRANSPARENT_KW)
+        body = button = path = None
+
+        if kind == 'system':
+            info = ctr.CTkLabel(
+                frame,
+                text="",
+                font=self._font_sys,
+                **self._INFO_LABEL_KW
+            )
+            info.pack(pady=3)
+        else:
+            extra_widgets_fn = self._build_download_widgets if kind == 'download' else None
+            body, info, button, path = self._build_bubble(frame, kind == 'sent', extra_widgets_fn)
+
+        item = canvas.create_window(0, 0, window=frame, anchor="nw", state="hidden")
+        return BubbleWidgets(kind, item, frame, body, info, button, path)
+
+    def _build_bubble(self, parent, is_sent: bool, extra_widgets_fn: Optional[Callable] = None):
+        # Susunan bubble yang sama untuk semua jenis pesan, extra_widgets_fn menambah widget di bawah isi.
+        # Semua widget dibuat dulu, geometry di-set sekali di akhir (isi bubble pakai grid)
+        if is_sent:
+            side, sticky, bubble_kw, bg = "right", "e", self._SENT_BUBBLE_KW, self.MESSAGE_SENT
+        else:
+            side, sticky, bubble_kw, bg = "left", "w", self._RCV_BUBBLE_KW, self.MESSAGE_RECEIVED
+
+        inner = ctr.CTkFrame(parent, **self._TRANSPARENT_KW)
+        bubble = ctr.CTkFrame(inner, **bubble_kw)
+        body = tk.Text(bubble, font=self._get_body_font(), width=1, height=1, bg=bg, **self._MSG_BODY_KW)
+        extra = (None, None) if extra_widgets_fn is None else extra_widgets_fn(bubble)
+        info = ctr.CTkLabel(
+            inner,
+            text="",
+            font=self._font_info,
+            **self._INFO_LABEL_KW
+        )
+
+        body.grid(row=0, column=0, padx=12, pady=8 if extra_widgets_fn is None else (8, 4))
+        if extra[0] is not None:
+            extra[0].grid(row=1, column=0, padx=12, pady=(0, 8))
+        bubble.grid(row=0, column=0, sticky=sticky)
+        info.grid(row=1, column=0, sticky=sticky, pady=(2, 0))
+        inner.pack(side=side, padx=10)
+        return (body, info) + extra
+
+    def _build_download_widgets(self, bubble):
+        # Tombol download + label lokasi file (label baru di-grid di row 2 setelah download selesai)
+        button = ctr.CTkButton(bubble, text="📥 Download",
+                               fg_color=self.ACCENT,
+                               hover_color="#22c55e",
+                               text_color=self.TEXT,
+                               font=self._font_btn,
+                               height=32, width=120)
+        path = ctr.CTkLabel(bubble, text="",
+                            font=self._font_info,
+                            text_color=self.TEXT_MUTED,
+                            wraplength=300)
+        return button, path
+
+    def _prebuild_rows(self):
+        # Isi pool di awal (saat idle) supaya scroll pertama tidak perlu membangun widget
+        for kind, count in self.POOL_PREBUILD.items():
+            pool = self._bubble_pool[kind]
+            for _ in range(count - len(pool)):
+                pool.append(self._build_row(kind))
+
+    def _acquire_row(self, record: Msg) -> BubbleWidgets:
+        # Ambil baris dari pool (atau bangun baru) lalu isi dengan record
+        kind = self._row_kind(record)
+        pool = self._bubble_pool[kind]
+        widgets = pool.pop() if pool else self._build_row(kind)
+
+        if kind == 'system':
+            widgets.info.configure(text=f"--- {record.msg} ---")
+        else:
+            self._set_body_text(widgets.body, self._record_text(record))
+            widgets.info.configure(text=record.info)
+            if kind == 'download':
+                self._update_download_row(widgets, record.file_id)
+
+        self.chat_canvas.itemconfigure(widgets.item, state="normal", width=self._canvas_width)
+        return widgets
+
+    def _release_row(self, widgets: BubbleWidgets):
+        # Sembunyikan baris dan kembalikan ke pool
+        self.chat_canvas.itemconfigure(widgets.item, state="hidden")
+        self._bubble_pool[widgets.kind].append(widgets)
+
+    def _set_body_text(self, body: tk.Text, text: str):
+        # Ganti isi tk.Text bubble, ukurannya dihitung dari metric font
+        width, lines = self._measure_text(text)
+        body.configure(state="normal", width=width, height=lines)
+        body.delete("1.0", "end")
+        body.insert("1.0", text)
+        body.configure(state="disabled")
+
+    def _update_download_row(self, widgets: BubbleWidgets, file_id: int):
+        # Sesuaikan tombol download dengan status file (belum, sedang disimpan, tersimpan, kedaluwarsa)
+        state = self._pf_state[file_id]
+        if state == self.FILE_SAVED:
+            widgets.button.configure(text="✅ Tersimpan", fg_color=self.GROUP, state="disabled", command=None)
+            widgets.path.configure(text=f"📂 {self._pf_path[file_id]}")
+            widgets.path.grid(row=2, column=0, padx=12, pady=(0, 8))
+            return
+
+        widgets.path.grid_remove()
+        if state == self.FILE_EXPIRED:
+            widgets.button.configure(text="⌛ Kedaluwarsa", fg_color=self.TEXT_MUTED, state="disabled", command=None)
+            return
+        saving = state == self.FILE_SAVING
+        widgets.button.configure(text="⏳ Menyimpan..." if saving else "📥 Download",
+                                 fg_color=self.ACCENT,
+                                 state="disabled" if saving else "normal",
+                                 command=self._btn_callbacks[file_id])
+
+    def _refresh_download_rows(self, file_id: int):
+        # Update baris download file_id kalau sedang tampil di viewport
+        for record, widgets in self._visible_rows.values():
+            if widgets.kind == 'download' and record.file_id == file_id:
+                self._update_download_row(widgets, file_id)
+                self._schedule_measure()
+
+    def _schedule_refresh(self):
+        # Gabungkan beberapa trigger (scroll, resize, pesan baru) jadi satu refresh saat idle
+        if not self._refresh_scheduled:
+            self._refresh_scheduled = True
+            self.root.after_idle(self._refresh_viewport)
+
+    def _refresh_viewport(self):
+        # Binary search y_offsets untuk record yang kelihatan, sisanya dikembalikan ke pool
+        self._refresh_scheduled = False
+        canvas = self.chat_canvas
+        tops = self._row_tops
+        top = canvas.canvasy(0)
+        first = max(0, bisect_right(tops, top) - 1)
+        last = bisect_left(tops, top + canvas.winfo_height())
+
+        history = self.chat_histories.get(self._shown_chat, ())
+        wanted = {id(record): (record, y) for record, y in zip(islice(history, first, last), tops[first:last])}
+
+        visible = self._visible_rows
+        for key in [key for key in visible if key not in wanted]:
+            self._release_row(visible.pop(key)[1])
+
+        half_gap = self.ROW_GAP // 2
+        for key, (record, y) in wanted.items():
+            entry = visible.get(key)
+            if entry is None:
+                entry = visible[key] = (record, self._acquire_row(record))
+            canvas.coords(entry[1].item, 0, y + half_gap)
+
+        if wanted:
+            self._schedule_measure()
+
+    def _schedule_measure(self):
+        # Koreksi tinggi dijadwalkan setelah geometry baris selesai dihitung
+        if not self._measure_scheduled:
+            self._measure_scheduled = True
+            self.root.after_idle(self._measure_rows)
+
+    def _measure_rows(self):
+        # Ganti tinggi estimasi dengan tinggi asli baris yang tampil, layout digeser kalau berbeda
+        self._measure_scheduled = False
+        canvas = self.chat_canvas
+        canvas.update_idletasks()
+
+        changed = False
+        for record, widgets in self._visible_rows.values():
+            height = widgets.frame.winfo_reqheight() + self.ROW_GAP
+            if height != record.height:
+                record.height = height
+                changed = True
+        if not changed:
+            return
+
+        at_bottom = canvas.yview()[1] >= 1.0
+        self._relayout()
+        if at_bottom:
+            canvas.yview_moveto(1.0)
+        self._refresh_viewport()
+
+    def _on_chat_yscroll(self, first: str, last: str):
+        # Teruskan posisi ke scrollbar dan render ulang viewport
+        self.chat_scrollbar.set(first, last)
+        self._schedule_refresh()
+
+    def _on_chat_configure(self, event):
+        # Lebar baris ikut lebar canvas, tinggi baru bisa memuat lebih banyak baris
+        if event.width != self._canvas_width:
+            self._canvas_width = event.width
+            for _, widgets in self._visible_rows.values():
+                self.chat_canvas.itemconfigure(widgets.item, width=event.width)
+            self._update_scrollregion()
+        self._schedule_refresh()
+
+    def _on_chat_wheel(self, event):
+        # Scroll chat pakai mouse wheel (Windows/macOS lewat delta, Linux lewat Button-4/5)
+        widget = str(event.widget)
+        canvas = str(self.chat_canvas)
+        if widget != canvas and not widget.startswith(canvas + "."):
+            return
+        step = -self.WHEEL_STEP if event.num == 4 or event.delta > 0 else self.WHEEL_STEP
+        self.chat_canvas.yview_scroll(step, "units")
+
+    def _store_message(self, chat_id: str, sender: str, message: str, is_sent: bool,
+                       msg_type: str = 'message', file_id: Optional[int] = None,
+                       meta: Optional[dict] = None) -> Msg:
+        # Store message ke chat history, info text (pengirim + jam) disusun sekali di sini
+        history = self.chat_histories.get(chat_id)
+        if history is None:
+            history = self.chat_histories[chat_id] = deque(maxlen=self.HISTORY_LIMIT)
+        evicted = history[0] if len(history) == history.maxlen else None
+
+        timestamp = self._hhmm_now()
+        info_text = f"You  •  {timestamp}" if is_sent else f"{sender}  •  {timestamp}"
+        record = Msg(timestamp, sender, message, is_sent, msg_type, info_text, file_id, 0, meta)
+        history.append(record)
+
+        if chat_id == self._shown_chat:
+            self._append_row(record, evicted)
+        return record
+    
+    def _hhmm_now(self) -> str:
+        # Jam "HH:MM" sekarang, strftime cuma dipanggil sekali per menit
+        t = time.time()
+        minute = int(t // 60)
+        cached = self._cached_minute
+        if minute == cached[0]:
+            return cached[1]
+        text = time.strftime("%H:%M", time.localtime(t))
+        self._cached_minute = (minute, text)
+        return text
     
     def set_server_info(self, ip: str, port: int):
         # Set informasi server
@@ -485,8 +938,8 @@ class ChatGUI:
     
     def _update_peers_list(self):
         # Update tampilan list peers
-        for widget in self.peers_frame.winfo_children():
-            widget.destroy()
+        for btn in self.peer_buttons.values():
+            btn.destroy()
         self.peer_buttons.clear()
         
         for peer_id, username in self.peers.items():
@@ -497,20 +950,24 @@ class ChatGUI:
                                text_color=self.COLORS['text'],
                                anchor="w",
                                height=35,
-                               font=ctr.CTkFont(size=13),
+                               font=self._font_msg,
                                command=lambda pid=peer_id: self._on_peer_click(pid))
             btn.pack(fill="x", pady=2)
             self.peer_buttons[peer_id] = btn
+        
+        if self.current_peer and not self.current_is_group:
+            self._update_selected_states(self.current_peer, is_group=False)
     
     def add_group(self, group_id: str, group_name: str):
         # Add group ke list
         self.groups[group_id] = group_name
+        self._ensure_groups_ui()
         self._update_groups_list()
     
     def _update_groups_list(self):
         # Update tampilan list groups
-        for widget in self.groups_frame.winfo_children():
-            widget.destroy()
+        for btn in self.group_buttons.values():
+            btn.destroy()
         self.group_buttons.clear()
         
         for group_id, group_name in self.groups.items():
@@ -521,158 +978,32 @@ class ChatGUI:
                                text_color=self.COLORS['text'],
                                anchor="w",
                                height=35,
-                               font=ctr.CTkFont(size=13),
+                               font=self._font_msg,
                                command=lambda gid=group_id: self._on_group_click(gid))
             btn.pack(fill="x", pady=2)
             self.group_buttons[group_id] = btn
+        
+        if self.current_peer and self.current_is_group:
+            self._update_selected_states(self.current_peer, is_group=True)
     
+    def _add_record(self, chat_id: str, sender: str, text: str, is_sent: bool,
+                    msg_type: str = 'message', file_id: Optional[int] = None, meta: Optional[dict] = None):
+        # Jalur bersama semua add_*: simpan ke model, scroll kalau chat-nya sedang tampil
+        self._store_message(chat_id, sender, text, is_sent, msg_type, file_id, meta)
+        if chat_id == self._shown_chat:
+            self._schedule_autoscroll()
+
     def add_message(self, sender: str, message: str, is_sent: bool = False, peer_id: str = None):
-        # Tambah pesan ke area chat dengan bubble
+        # Tambah pesan ke model chat, viewport cukup di-refresh sekali
         chat_id = peer_id if peer_id else self.current_peer
         if not chat_id:
             return
 
-        self._store_message(chat_id, sender, message, is_sent, 'message')
-
-        if chat_id == self.current_peer:
-            timestamp = datetime.now().strftime("%H:%M")
-            
-            if is_sent:
-                self._add_sent_bubble(sender, message, timestamp)
-            else:
-                self._add_received_bubble(sender, message, timestamp)
-
-            self.chat_frame._parent_canvas.yview_moveto(1.0)
-
-    def _add_sent_bubble(self, sender: str, message: str, timestamp: str):
-       # Buat bubble untuk pesan yang terkirim
-        container = ctr.CTkFrame(self.chat_frame, fg_color="transparent")
-        container.pack(fill="x", pady=5)
-        inner = ctr.CTkFrame(container, fg_color="transparent")
-        inner.pack(side="right", anchor="e", padx=10)
-
-        bubble = ctr.CTkFrame(inner, fg_color=self.COLORS['message_sent'], corner_radius=12)
-        bubble.pack(anchor="e")
-        
-        msg_label = ctr.CTkLabel(
-            bubble,
-            text=message,
-            font=ctr.CTkFont(size=13),
-            text_color=self.COLORS['text'],
-            wraplength=350,
-            justify="left",
-            anchor="w"
-        )
-        msg_label.pack(padx=12, pady=8)
-        
-        info_label = ctr.CTkLabel(
-            inner,
-            text=f"You  •  {timestamp}",
-            font=ctr.CTkFont(size=10),
-            text_color=self.COLORS['text_muted']
-        )
-        info_label.pack(anchor="e", pady=(2, 0))
-
-    def _add_received_bubble(self, sender: str, message: str, timestamp: str):
-        # Buat bubble untuk pesan yang terkirim
-        container = ctr.CTkFrame(self.chat_frame, fg_color="transparent")
-        container.pack(fill="x", pady=5)
-        inner = ctr.CTkFrame(container, fg_color="transparent")
-        inner.pack(side="left", anchor="w", padx=10)
-        
-        bubble = ctr.CTkFrame(inner, fg_color=self.COLORS['message_received'], corner_radius=12)
-        bubble.pack(anchor="w")
-        
-        msg_label = ctr.CTkLabel(
-            bubble,
-            text=message,
-            font=ctr.CTkFont(size=13),
-            text_color=self.COLORS['text'],
-            wraplength=350,
-            justify="left",
-            anchor="w"
-        )
-        msg_label.pack(padx=12, pady=8)
-        
-        info_label = ctr.CTkLabel(
-            inner,
-            text=f"{sender}  •  {timestamp}",
-            font=ctr.CTkFont(size=10),
-            text_color=self.COLORS['text_muted']
-        )
-        info_label.pack(anchor="w", pady=(2, 0))
+        self._add_record(chat_id, sender, message, is_sent)
 
     def add_group_message(self, group_id: str, sender: str, message: str, is_sent: bool = False):
         # Tambah pesan group ke chat
-        self._store_message(group_id, sender, message, is_sent, 'message')
-        
-        if group_id == self.current_peer and self.current_is_group:
-            timestamp = datetime.now().strftime("%H:%M")
-            
-            if is_sent:
-                self._add_group_sent_bubble(sender, message, timestamp)
-            else:
-                self._add_group_received_bubble(sender, message, timestamp)
-            
-            self.chat_frame._parent_canvas.yview_moveto(1.0)
-
-    def _add_group_sent_bubble(self, sender: str, message: str, timestamp: str):
-        # Bubble pesan group yg terkirim
-        container = ctr.CTkFrame(self.chat_frame, fg_color="transparent")
-        container.pack(fill="x", pady=5)
-        inner = ctr.CTkFrame(container, fg_color="transparent")
-        inner.pack(side="right", anchor="e", padx=10)
-        
-        bubble = ctr.CTkFrame(inner, fg_color=self.COLORS['message_sent'], corner_radius=12)
-        bubble.pack(anchor="e")
-        
-        msg_label = ctr.CTkLabel(
-            bubble,
-            text=message,
-            font=ctr.CTkFont(size=13),
-            text_color=self.COLORS['text'],
-            wraplength=350,
-            justify="left",
-            anchor="w"
-        )
-        msg_label.pack(padx=12, pady=8)
-
-        info_label = ctr.CTkLabel(
-            inner,
-            text=f"You  •  {timestamp}",
-            font=ctr.CTkFont(size=10),
-            text_color=self.COLORS['text_muted']
-        )
-        info_label.pack(anchor="e", pady=(2, 0))
-
-    def _add_group_received_bubble(self, sender: str, message: str, timestamp: str):
-        # Bubble pesan group yg diterima
-        container = ctr.CTkFrame(self.chat_frame, fg_color="transparent")
-        container.pack(fill="x", pady=5)
-        inner = ctr.CTkFrame(container, fg_color="transparent")
-        inner.pack(side="left", anchor="w", padx=10)
-        
-        bubble = ctr.CTkFrame(inner, fg_color=self.COLORS['message_received'], corner_radius=12)
-        bubble.pack(anchor="w")
-        
-        msg_label = ctr.CTkLabel(
-            bubble,
-            text=message,
-            font=ctr.CTkFont(size=13),
-            text_color=self.COLORS['text'],
-            wraplength=350,
-            justify="left",
-            anchor="w"
-        )
-        msg_label.pack(padx=12, pady=8)
-        
-        info_label = ctr.CTkLabel(
-            inner,
-            text=f"{sender}  •  {timestamp}",
-            font=ctr.CTkFont(size=10),
-            text_color=self.COLORS['text_muted']
-        )
-        info_label.pack(anchor="w", pady=(2, 0))
+        self._add_record(group_id, sender, message, is_sent)
 
     def add_file_message(self, sender: str, filename: str, is_sent: bool = False, peer_id: str = None):
         # Tambah notifikasi file ke chat
@@ -680,191 +1011,147 @@ class ChatGUI:
         if not chat_id:
             return
         
-        action = "mengirim" if is_sent else "mengirim"
-        prefix = "You" if is_sent else sender
-        msg = f"{prefix} {action} file: {filename}"
-        
-        self._store_message(chat_id, sender, msg, is_sent, 'file')
-        
-        if chat_id == self.current_peer:
-            timestamp = datetime.now().strftime("%H:%M")
-            self._add_file_bubble(sender, filename, timestamp, is_sent)
-            self.chat_frame._parent_canvas.yview_moveto(1.0)
+        self._add_record(chat_id, sender, filename, is_sent, 'file', meta={'filename': filename, 'size': 0})
     
-    def _add_file_bubble(self, sender: str, filename: str, timestamp: str, is_sent: bool):
-        # Bubble untuk file message
-        container = ctr.CTkFrame(self.chat_frame, fg_color="transparent")
-        container.pack(fill="x", pady=5)
-        
-        if is_sent:
-            inner = ctr.CTkFrame(container, fg_color="transparent")
-            inner.pack(side="right", anchor="e", padx=10)
-            bubble_color = self.COLORS['message_sent']
-            anchor = "e"
-            info_text = f"You  •  {timestamp}"
-        else:
-            inner = ctr.CTkFrame(container, fg_color="transparent")
-            inner.pack(side="left", anchor="w", padx=10)
-            bubble_color = self.COLORS['message_received']
-            anchor = "w"
-            info_text = f"{sender}  •  {timestamp}"
-        
-        bubble = ctr.CTkFrame(inner, fg_color=bubble_color, corner_radius=12)
-        bubble.pack(anchor=anchor)
-        
-        msg_label = ctr.CTkLabel(
-            bubble,
-            text=f"📁 {filename}",
-            font=ctr.CTkFont(size=13),
-            text_color=self.COLORS['text'],
-            wraplength=350,
-            justify="left",
-            anchor="w"
-        )
-        msg_label.pack(padx=12, pady=8)
-        
-        info_label = ctr.CTkLabel(
-            inner,
-            text=info_text,
-            font=ctr.CTkFont(size=10),
-            text_color=self.COLORS['text_muted']
-        )
-        info_label.pack(anchor=anchor, pady=(2, 0))
-    
-    def add_file_message_with_download(self, sender: str, filename: str, file_id: str, filesize: int = 0, peer_id: str = None):
+    def add_file_message_with_download(self, sender: str, filename: str, file_id: int, filesize: int = 0, peer_id: str = None):
         # Tambah notifikasi file dan tombol download ke chat
         chat_id = peer_id if peer_id else self.current_peer
-        timestamp = datetime.now().strftime("%H:%M")
 
-        if filesize > 0:
-            if filesize < 1024:
-                size_str = f"{filesize} B"
-            elif filesize < 1024 * 1024:
-                size_str = f"{filesize / 1024:.1f} KB"
-            else:
-                size_str = f"{filesize / (1024 * 1024):.1f} MB"
-            size_info = f" ({size_str})"
-        else:
-            size_info = ""
-        
-        msg = f"{sender} mengirim file: {filename}{size_info}"
-        self._store_message(chat_id, sender, msg, False, 'file')
-        
-        container = ctr.CTkFrame(self.chat_frame, fg_color="transparent")
-        container.pack(fill="x", pady=5)
-        
-        inner = ctr.CTkFrame(container, fg_color="transparent")
-        inner.pack(side="left", anchor="w", padx=10)
-
-        bubble = ctr.CTkFrame(inner, fg_color=self.COLORS['message_received'], corner_radius=12)
-        bubble.pack(anchor="w")
-        
-        msg_label = ctr.CTkLabel(
-            bubble,
-            text=f"📁 {filename}{size_info}",
-            font=ctr.CTkFont(size=13),
-            text_color=self.COLORS['text'],
-            wraplength=350,
-            justify="left",
-            anchor="w"
-        )
-        msg_label.pack(padx=12, pady=(8, 4))
-
-        download_btn = ctr.CTkButton(bubble, text="📥 Download",
-                                    fg_color=self.COLORS['accent'],
-                                    hover_color="#22c55e",
-                                    text_color=self.COLORS['text'],
-                                    font=ctr.CTkFont(size=12, weight="bold"),
-                                    height=32, width=120,
-                                    command=lambda fid=file_id: self._on_download_click(fid))
-        download_btn.pack(padx=12, pady=(0, 8))
-        
-        info_label = ctr.CTkLabel(
-            inner,
-            text=f"{sender}  •  {timestamp}",
-            font=ctr.CTkFont(size=10),
-            text_color=self.COLORS['text_muted']
-        )
-        info_label.pack(anchor="w", pady=(2, 0))
-        
-        self.pending_files[file_id] = {
-            'filename': filename,
-            'button': download_btn,
-            'bubble': bubble
-        }
-        
-        self.chat_frame._parent_canvas.yview_moveto(1.0)
+        # Status download disimpan di model, baris download dibuat saat masuk viewport
+        missing = file_id + 1 - len(self._pf_state)
+        if missing > 0:
+            self._pf_filename.extend([None] * missing)
+            self._pf_state.extend([None] * missing)
+            self._pf_path.extend([None] * missing)
+            self._btn_callbacks.extend([None] * missing)
+        self._pf_filename[file_id] = filename
+        self._pf_state[file_id] = self.FILE_PENDING
+        self._btn_callbacks[file_id] = partial(self._on_download_click, file_id)
+        self._add_record(chat_id, sender, filename, False, 'file', file_id,
+                         {'filename': filename, 'size': filesize})
     
-    def _on_download_click(self, file_id: str):
+    def _on_download_click(self, file_id: int):
         # Handle klik tombol download
-        if file_id in self.pending_files:
-            file_info = self.pending_files[file_id]
-            file_info['button'].configure(text="⏳ Menyimpan...", state="disabled")
-            
-            if self.on_download_file:
-                self.on_download_file(file_id)
+        if self._pf_state[file_id] != self.FILE_PENDING:
+            return
+        self._pf_state[file_id] = self.FILE_SAVING
+        self._refresh_download_rows(file_id)
+        
+        if self.on_download_file:
+            self.on_download_file(file_id)
     
-    def mark_file_downloaded(self, file_id: str, save_path: str):
+    def mark_file_downloaded(self, file_id: int, save_path: str):
         # Tandai file sudah didownload
-        if file_id in self.pending_files:
-            file_info = self.pending_files[file_id]
-            
-            file_info['button'].configure(
-                text="✅ Tersimpan",
-                fg_color=self.COLORS['group'],
-                text_color=self.COLORS['text'],
-                state="disabled"
-            )
-            
-            if 'bubble' in file_info:
-                loc_label = ctr.CTkLabel(
-                    file_info['bubble'],
-                    text=f"📂 {save_path}",
-                    font=ctr.CTkFont(size=10),
-                    text_color=self.COLORS['text_muted'],
-                    wraplength=300
-                )
-                loc_label.pack(padx=12, pady=(0, 8))
-            
-            del self.pending_files[file_id]
+        if file_id < len(self._pf_state) and self._pf_state[file_id] is not None:
+            self._pf_state[file_id] = self.FILE_SAVED
+            self._pf_path[file_id] = save_path
+            self._btn_callbacks[file_id] = None
+            self._refresh_download_rows(file_id)
+    
+    def reset_download_row(self, file_id: int):
+        # Penyimpanan gagal tapi data masih ada, tombol download bisa dipakai lagi
+        if file_id < len(self._pf_state) and self._pf_state[file_id] == self.FILE_SAVING:
+            self._pf_state[file_id] = self.FILE_PENDING
+            self._refresh_download_rows(file_id)
+    
+    def expire_pending_file(self, file_id: int):
+        # Tandai file yang datanya sudah dibuang sebelum sempat disimpan (termasuk yang baru diklik download)
+        if file_id < len(self._pf_state) and self._pf_state[file_id] in (self.FILE_PENDING, self.FILE_SAVING):
+            self._pf_state[file_id] = self.FILE_EXPIRED
+            self._btn_callbacks[file_id] = None
+            self._refresh_download_rows(file_id)
     
     def add_system_message(self, message: str, chat_id: str = None):
-        # Tambah pesan sistem ke chat
-        if chat_id:
-            self._store_message(chat_id, "", message, False, 'system')
-
-        sys_frame = ctr.CTkFrame(self.chat_frame, fg_color="transparent")
-        sys_frame.pack(fill="x", pady=8)
-        
-        sys_label = ctr.CTkLabel(
-            sys_frame,
-            text=f"--- {message} ---",
-            font=ctr.CTkFont(size=10, slant="italic"),
-            text_color=self.COLORS['text_muted']
-        )
-        sys_label.pack()
+        # Tambah pesan sistem ke chat, default ke chat yang sedang tampil
+        if not chat_id:
+            chat_id = self._shown_chat
+        self._add_record(chat_id, "", message, False, 'system')
 
-    
     def show_progress(self, filename: str, progress: float):
-        # Tampilkan progress transfer file
+        # Tampilkan progress transfer file, filename sudah berupa basename dari network
         if progress <= 0:
-            self.progress_frame.grid_forget()
+            if self.progress_frame is not None:
+                self.progress_frame.grid_forget()
         else:
+            # Perubahan < 1% atau terlalu rapat tidak kelihatan, cukup di-skip. 100% selalu diproses
+            if progress < 100:
+                now = time.monotonic()
+                percent = int(progress)
+                if percent == self._last_progress_pct or now - self._last_progress_ts < self.PROGRESS_INTERVAL:
+                    return
+                self._last_progress_pct = percent
+                self._last_progress_ts = now
+            else:
+                self._last_progress_pct = -1
+
+            self._ensure_progress_ui()
             self.progress_frame.grid(row=2, column=0, sticky="ew", padx=10, pady=5)
-            self.progress_label.configure(text=f"Transferring: {os.path.basename(filename)}")
+            self.progress_label.configure(text=f"Transferring: {filename}")
             self.progress_bar.set(progress / 100)
             
             if progress >= 100:
                 self.root.after(1000, lambda: self.progress_frame.grid_forget())
     
     def show_error(self, message: str):
-        # Tampilkan pesan error
-        messagebox.showerror("Error", message)
+        # Tampilkan pesan error sebagai toast (tidak blocking)
+        self._show_toast(f"⚠️ {message}", self.COLORS['warning'])
     
     def show_info(self, message: str):
-        # Tampilkan pesan info
-        messagebox.showinfo("Info", message)
+        # Tampilkan pesan info sebagai toast (tidak blocking)
+        self._show_toast(f"ℹ️ {message}", self.COLORS['bg_light'])
+
+    def _show_toast(self, message: str, color: str):
+        # Satu toast di pojok kanan bawah dipakai ulang, pesan beruntun cukup ganti teks dan perpanjang timer
+        if self._toast_frame is None:
+            self._toast_frame = ctr.CTkFrame(self.root, corner_radius=10)
+            self._toast_label = ctr.CTkLabel(self._toast_frame, text="",
+                                             font=self._font_msg,
+                                             text_color=self.TEXT,
+                                             wraplength=320,
+                                             justify="left")
+            self._toast_label.pack(padx=14, pady=10)
+
+        self._toast_frame.configure(fg_color=color)
+        self._toast_label.configure(text=message)
+        self._toast_frame.place(relx=1.0, rely=1.0, x=-20, y=-90, anchor="se")
+        self._toast_frame.lift()
+
+        if self._toast_after is not None:
+            self.root.after_cancel(self._toast_after)
+        self._toast_after = self.root.after(self.TOAST_MS, self._hide_toast)
+
+    def _hide_toast(self):
+        # Sembunyikan toast setelah timeout
+        self._toast_after = None
+        self._toast_frame.place_forget()
     
+    def post(self, fn: Callable):
+        # Titip callback dari thread lain, dijalankan di UI thread pada tick pump berikutnya
+        self._ui_queue.append(fn)
+
+    def post_progress(self, peer_id: str, filename: str, progress: float):
+        # Titip progress transfer, hanya nilai terakhir per (peer, file) yang ditampilkan
+        self._pending_progress[(peer_id, filename)] = progress
+
+    def _drain_ui_queue(self):
+        # Jalankan antrian UI per batch, redraw sekali di akhir tick, lalu jadwalkan tick berikutnya
+        queue = self._ui_queue
+        pending = self._pending_progress
+        changed = bool(queue or pending)
+        for _ in range(min(len(queue), self.UI_BATCH)):
+            try:
+                queue.popleft()()
+            except Exception as e:
+                print(f"Error UI callback: {e}")
+
+        while pending:
+            (_, filename), progress = pending.popitem()
+            self.show_progress(filename, progress)
+
+        if changed:
+            self.root.update_idletasks()
+        self.root.after(self.UI_TICK_MS, self._drain_ui_queue)
+
     def run(self):
         # Jalankan GUI
         self.root.mainloop()
@@ -1,15 +1,27 @@
+import asyncio
+import logging
+import logging.handlers
+import mmap
 import os
+import queue
+import secrets
 import threading
-import uuid
-import tkinter as tk
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from functools import partial
 from tkinter import simpledialog, messagebox
-from datetime import datetime
-from crypto import CryptoManager
+from buffer_pool import BufferPool
+from crypto import AEAD_TAG_SIZE, CryptoManager
 from network import P2PNode, get_local_ip
 from gui import ChatGUI
 
+logger = logging.getLogger(__name__)
+
 class P2PChatApp:
     DOWNLOAD_DIR = "downloads"
+    PEER_QUEUE_SIZE = 32  # Maks pesan masuk per peer yang menunggu diproses
+    SUBMIT_POLL = 0.5  # Detik, thread network mengecek ulang apakah app sedang ditutup selama antrian penuh
+    PENDING_BUDGET = 1024 * 1024 * 1024  # Maks total ukuran file sementara yang belum disimpan
     
     def __init__(self):
         # Inisialisasi
@@ -19,9 +31,28 @@ class P2PChatApp:
         self.crypto = CryptoManager()
         self.network: P2PNode = None
         self.gui = ChatGUI()
+        self._post = self.gui.post  # Dipanggil dari thread lain di tiap event, disimpan sebagai bound method
         self.username = ""
-        self.pending_downloads = {}
-        self.file_counter = 0
+        self._username_cache: dict = {}  # peer_id -> username selama peer terkoneksi
+        # File yang menunggu didownload, list paralel dengan index = file_id
+        self._pd_peer: list = []
+        self._pd_save_path: list = []  # path tujuan, dipilih saat file diterima
+        self._pd_data: list = []  # encrypted_data, None setelah tersimpan
+        self._pd_lock = threading.Lock()
+        self._pd_live: OrderedDict = OrderedDict()  # file_id -> filesize, file sementara masih ada (urut kedatangan)
+        self._pd_bytes = 0
+        # Worker kirim/simpan file dipakai ulang, jumlahnya dibatasi
+        self._io_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="p2p-io")
+        # Slab baca/dekripsi file: satu chunk plaintext, ditambah tag supaya juga muat satu chunk ciphertext
+        self._buffers = BufferPool(P2PNode.CHUNK_SIZE + AEAD_TAG_SIZE)
+        # Satu event loop asyncio di thread sendiri untuk semua pekerjaan I/O dan crypto, to_thread memakai _io_pool
+        self._loop = asyncio.new_event_loop()
+        self._loop.set_default_executor(self._io_pool)
+        threading.Thread(target=self._loop.run_forever, name="p2p-loop", daemon=True).start()
+        # Antrian asyncio per peer (hanya disentuh dari thread loop), diproses satu task per peer
+        self._peer_queues: dict = {}
+        self._peer_tasks: dict = {}
+        self._closing = threading.Event()
         self._setup_callbacks()
     
     def _setup_callbacks(self):
@@ -38,11 +69,74 @@ class P2PChatApp:
         self.network.on_peer_connected = self._on_peer_connected
         self.network.on_peer_disconnected = self._on_peer_disconnected
         self.network.on_public_key_received = self._on_public_key_received
-        self.network.on_message_received = self._on_message_received
-        self.network.on_file_received = self._on_file_received
-        self.network.on_file_progress = self._on_file_progress
+        self.network.on_message_received = partial(self._submit, self._on_message_received)
+        self.network.on_file_received = partial(self._submit, self._on_file_received)
+        # Progress langsung diteruskan ke GUI tanpa lapisan method tambahan
+        self.network.on_file_progress = self.gui.post_progress
         self.network.on_group_invite_received = self._on_group_invite_received
-        self.network.on_group_message_received = self._on_group_message_received
+        self.network.on_group_message_received = partial(self._submit, self._on_group_message_received)
+    
+    def _submit(self, handler, peer_id: str, *args):
+        # Dipanggil dari thread network: masukkan coroutine ke antrian peer, block kalau antrian penuh (backpressure)
+        # Menunggu dengan timeout supaya thread tidak macet selamanya kalau app ditutup saat antrian penuh
+        job = partial(handler, peer_id, *args)
+        if self._closing.is_set() or not self._loop.is_running():
+            self._discard_job(job)
+            return
+        future = asyncio.run_coroutine_threadsafe(self._enqueue(peer_id, job), self._loop)
+        while True:
+            try:
+                future.result(self.SUBMIT_POLL)
+                return
+            except FutureTimeout:
+                if self._closing.is_set() or not self._loop.is_running():
+                    future.cancel()
+                    self._discard_job(job)
+                    return
+    
+    def _discard_job(self, job):
+        # Job yang tidak akan pernah jalan: file sementara milik job file dihapus
+        if job.func == self._on_file_received:
+            job.args[2]['encrypted_file'].discard()
+    
+    async def _enqueue(self, peer_id: str, job):
+        # Masukkan job ke antrian peer, consumer dibuat saat pesan pertama dari peer itu
+        queue = self._peer_queues.get(peer_id)
+        if queue is None:
+            queue = self._peer_queues[peer_id] = asyncio.Queue(self.PEER_QUEUE_SIZE)
+            self._peer_tasks[peer_id] = self._loop.create_task(self._consume(queue))
+        await queue.put(job)
+    
+    async def _consume(self, queue: asyncio.Queue):
+        # Proses pesan satu peer berurutan sampai ketemu None (peer disconnect)
+        while True:
+            job = await queue.get()
+            if job is None:
+                return
+            try:
+                await job()
+            except Exception as e:
+                logger.warning("Error processing peer message: %s", e)
+    
+    def _drop_peer_queue(self, peer_id: str):
+        # Peer disconnect (jalan di thread loop): pesan yang sudah masuk antrian tetap diproses,
+        # None di akhir antrian menghentikan consumer-nya
+        queue = self._peer_queues.pop(peer_id, None)
+        self._peer_tasks.pop(peer_id, None)
+        if queue is not None:
+            self._loop.create_task(queue.put(None))
+    
+    def _discard_queued(self):
+        # Saat app ditutup (jalan di thread loop): buang job yang belum sempat jalan beserta file sementaranya
+        for queue in self._peer_queues.values():
+            while not queue.empty():
+                job = queue.get_nowait()
+                if job is not None:
+                    self._discard_job(job)
+        for task in self._peer_tasks.values():
+            task.cancel()
+        self._peer_queues.clear()
+        self._peer_tasks.clear()
     
     def _on_connect(self, ip: str, port: int):
         # Handle koneksi ke peer
@@ -55,20 +149,26 @@ class P2PChatApp:
     
     def _on_peer_connected(self, peer_id: str, username: str):
         # Handle peer baru terkoneksi
-        print(f"[INFO] Peer connected: {username}")
-        self.network.send_public_key(peer_id, self.crypto.get_public_key())
-        self.gui.root.after(0, lambda: self.gui.add_peer(peer_id, username))
+        logger.info("Peer connected: %s", username)
+        self._username_cache[peer_id] = username
+        self.network.send_public_key(peer_id, self.crypto.get_public_key_bytes())
+        self._post(partial(self.gui.add_peer, peer_id, username))
     
     def _on_peer_disconnected(self, peer_id: str, username: str):
         # Handle peer disconnect
-        self.gui.root.after(0, lambda: self.gui.remove_peer(peer_id))
+        self._username_cache.pop(peer_id, None)
+        self._loop.call_soon_threadsafe(self._drop_peer_queue, peer_id)
+        self._post(partial(self.gui.remove_peer, peer_id))
+    
+    def _peer_name(self, peer_id: str) -> str:
+        # Username peer dari cache, fallback ke network
+        return self._username_cache.get(peer_id) or self.network.get_peer_username(peer_id)
     
     def _on_public_key_received(self, peer_id: str, public_key: bytes):
         # Handle penerimaan public key dari peer
-        self.crypto.import_peer_public_key(peer_id, public_key)
-        self.gui.root.after(0, lambda: self.gui.add_system_message(
-            f"🔐 Kunci enkripsi diterima dari {self.network.get_peer_username(peer_id)}"
-        ))
+        self.crypto.import_peer_public_key(peer_id, public_key, self.network.peer_aeads.get(peer_id))
+        username = self._peer_name(peer_id)
+        self._post(partial(self.gui.add_system_message, f"🔐 Kunci enkripsi diterima dari {username}"))
     
     def _on_send_message(self, peer_id: str, message: str):
         # Handle pengiriman pesan
@@ -76,7 +176,7 @@ class P2PChatApp:
             encrypted = self.crypto.encrypt_message(message, peer_id)
             success = self.network.send_chat(peer_id, encrypted)
             if success:
-                username = self.network.get_peer_username(peer_id)
+                username = self._peer_name(peer_id)
                 self.gui.add_message(username, message, is_sent=True, peer_id=peer_id)
             else:
                 self.gui.show_error("Gagal mengirim pesan!")
@@ -85,124 +185,252 @@ class P2PChatApp:
         except Exception as e:
             self.gui.show_error(f"Error: {str(e)}")
     
-    def _on_message_received(self, peer_id: str, encrypted_data: dict):
-        # Handle penerimaan pesan
+    async def _on_message_received(self, peer_id: str, encrypted_data: dict):
+        # Handle penerimaan pesan, dekripsi di thread pool
         try:
-            message = self.crypto.decrypt_message(encrypted_data, peer_id)
-            username = self.network.get_peer_username(peer_id)
-            self.gui.root.after(0, lambda: self.gui.add_message(
-                username, message, is_sent=False, peer_id=peer_id
-            ))
+            message = await asyncio.to_thread(self.crypto.decrypt_message, encrypted_data, peer_id)
+            username = self._peer_name(peer_id)
+            self._post(partial(self.gui.add_message, username, message, False, peer_id))
         except Exception as e:
-            print(f"Error dekripsi pesan: {e}")
+            logger.warning("Error dekripsi pesan: %s", e)
     
     def _on_send_file(self, peer_id: str, filepath: str):
-        # Handle pengiriman file
-        def send_file_thread():
+        # Handle pengiriman file, dijadwalkan ke event loop
+        asyncio.run_coroutine_threadsafe(self._on_send_file_async(peer_id, filepath), self._loop)
+    
+    async def _on_send_file_async(self, peer_id: str, filepath: str):
+        # File dibaca, dienkripsi, dan dikirim per chunk; baca disk dan kirim socket jalan di thread pool
+        try:
+            filename = os.path.basename(filepath)
+            encryptor = self.crypto.start_stream_encrypt(peer_id)
+            fd, filesize = await asyncio.to_thread(self._open_for_send, filepath)
             try:
-                with open(filepath, 'rb') as f:
-                    file_data = f.read()
-                filename = os.path.basename(filepath)
-                encrypted = self.crypto.encrypt_file(file_data, peer_id)
-
-                self.network.send_file(peer_id, filename, encrypted)
-                self.gui.root.after(0, lambda: self.gui.add_file_message(
-                    self.network.get_peer_username(peer_id),
-                    filename,
-                    is_sent=True,
-                    peer_id=peer_id
-                ))
-            except ValueError as e:
-                self.gui.root.after(0, lambda: self.gui.show_error(str(e)))
-            except Exception as e:
-                self.gui.root.after(0, lambda: self.gui.show_error(f"Error: {str(e)}"))
-
-        threading.Thread(target=send_file_thread, daemon=True).start()
+                file_id = await asyncio.to_thread(
+                    self.network.send_file_start, peer_id, filename, filesize, encryptor.nonce)
+                if file_id is None:
+                    raise ValueError("Peer tidak terhubung")
+                send_chunk = partial(self.network.send_file_chunk, peer_id, file_id)
+                if filesize >= self.network.CHUNK_SIZE:
+                    await self._send_mapped(fd, filesize, encryptor, send_chunk)
+                else:
+                    await self._send_buffered(fd, encryptor, send_chunk)
+                await asyncio.to_thread(self.network.send_file_end, peer_id, file_id)
+            finally:
+                os.close(fd)
+            username = self._peer_name(peer_id)
+            self._post(partial(self.gui.add_file_message, username, filename, True, peer_id))
+        except ValueError as e:
+            self._post(partial(self.gui.show_error, str(e)))
+        except Exception as e:
+            self._post(partial(self.gui.show_error, f"Error: {str(e)}"))
+    
+    async def _send_mapped(self, fd: int, filesize: int, encryptor, send_chunk):
+        # File besar: dienkripsi langsung dari page cache lewat mmap, tanpa disalin ke buffer dulu
+        chunk_size = self.network.CHUNK_SIZE
+        view = memoryview(mmap.mmap(fd, filesize, access=mmap.ACCESS_READ))
+        sending = None
+        try:
+            for offset in range(0, filesize, chunk_size):
+                # Page fault saat enkripsi bisa menunggu disk, jadi enkripsi jalan di thread pool,
+                # bersamaan dengan kiriman chunk sebelumnya
+                ciphertext = await asyncio.to_thread(encryptor.update, view[offset:offset + chunk_size])
+                if ciphertext is not None:
+                    sending = await self._send_after(sending, send_chunk, ciphertext)
+            sending = await self._send_after(sending, send_chunk, encryptor.finalize())
+            await sending
+        finally:
+            await self._settle_send(sending)
+            # mmap ikut dilepas setelah slice terakhir tidak dipakai lagi
+            view.release()
+    
+    async def _send_after(self, previous, send_chunk, ciphertext):
+        # Tunggu kiriman sebelumnya (urutan chunk terjaga), lalu mulai kiriman ini di thread pool tanpa ditunggu
+        if previous is not None:
+            await previous
+        return asyncio.ensure_future(asyncio.to_thread(send_chunk, ciphertext))
+    
+    async def _settle_send(self, sending):
+        # Kalau loop kirim berhenti karena error, tunggu kiriman yang masih jalan tanpa melempar error kedua
+        if sending is not None:
+            await asyncio.gather(sending, return_exceptions=True)
+    
+    async def _send_buffered(self, fd: int, encryptor, send_chunk):
+        # File kecil: baca per chunk ke slab dari pool
+        chunk_size = self.network.CHUNK_SIZE
+        # Dua slab bergantian: encryptor menahan chunk sebelumnya selama chunk berikutnya dibaca
+        bufs = [self._buffers.acquire(), self._buffers.acquire()]
+        # readinto lewat FileIO tanpa buffer jalan di semua OS (os.readv tidak ada di Windows); fd tetap milik pemanggil
+        reader = open(fd, 'rb', buffering=0, closefd=False)
+        sending = None
+        try:
+            while True:
+                view = memoryview(bufs[0])[:chunk_size]
+                n = await asyncio.to_thread(reader.readinto, view)
+                if not n:
+                    break
+                ciphertext = encryptor.update(view[:n])
+                if ciphertext is not None:
+                    sending = await self._send_after(sending, send_chunk, ciphertext)
+                bufs.reverse()
+            sending = await self._send_after(sending, send_chunk, encryptor.finalize())
+            await sending
+        finally:
+            await self._settle_send(sending)
+            reader.close()
+            for buf in bufs:
+                self._buffers.release(buf)
+    
+    def _open_for_send(self, filepath: str):
+        # Buka file dan ambil ukurannya dalam satu kali lompat ke thread pool
+        fd = os.open(filepath, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+        try:
+            return fd, os.fstat(fd).st_size
+        except Exception:
+            os.close(fd)
+            raise
     
-    def _on_file_received(self, peer_id: str, filename: str, encrypted_data: dict):
+    async def _on_file_received(self, peer_id: str, filename: str, encrypted_data: dict):
         # Handle penerimaan file
         try:
-            self.file_counter += 1
-            file_id = f"file_{self.file_counter}_{datetime.now().strftime('%H%M%S')}"
-            encrypted_file_data = encrypted_data.get('encrypted_file', '')
-            filesize = len(encrypted_file_data) if isinstance(encrypted_file_data, bytes) else len(encrypted_file_data)
-            
-            self.pending_downloads[file_id] = {
-                'peer_id': peer_id,
-                'filename': filename,
-                'encrypted_data': encrypted_data,
-                'filesize': filesize
-            }
-            username = self.network.get_peer_username(peer_id)
-            self.gui.root.after(0, lambda: self.gui.add_file_message_with_download(
-                username, filename, file_id, filesize, peer_id
-            ))
+            filesize = encrypted_data.get('filesize', 0)
+            # Budget dihitung dari ciphertext yang benar-benar tersimpan, bukan ukuran klaim pengirim
+            spooled = encrypted_data.get('size', filesize)
+            # Cek nama file di disk dilakukan sekarang, bukan saat user menekan download
+            save_path = await asyncio.to_thread(self._pick_save_path, filename)
+            # file_id dialokasikan di thread loop, lock menjaga pembacaan dari thread lain
+            with self._pd_lock:
+                file_id = len(self._pd_data)
+                self._pd_peer.append(peer_id)
+                self._pd_save_path.append(save_path)
+                self._pd_data.append(encrypted_data)
+                self._pd_live[file_id] = spooled
+                self._pd_bytes += spooled
+                expired = self._evict_pending()
+            username = self._peer_name(peer_id)
+            self._post(partial(self.gui.add_file_message_with_download,
+                                  username, filename, file_id, filesize, peer_id))
+            for old_id in expired:
+                self._post(partial(self.gui.expire_pending_file, old_id))
+            if expired:
+                self._post(partial(self.gui.show_info, f"{len(expired)} file lama yang belum disimpan dibuang, minta kirim ulang"))
         except Exception as e:
-            print(f"Error receiving file: {e}")
-            self.gui.root.after(0, lambda: self.gui.show_error(f"Gagal menerima file: {str(e)}"))
+            logger.warning("Error receiving file: %s", e)
+            self._post(partial(self.gui.show_error, f"Gagal menerima file: {str(e)}"))
+    
+    def _evict_pending(self) -> list:
+        # Buang data file terlama selama total melebihi budget, file terbaru selalu disimpan (panggil dengan lock)
+        expired = []
+        while self._pd_bytes > self.PENDING_BUDGET and len(self._pd_live) > 1:
+            old_id, size = self._pd_live.popitem(last=False)
+            self._pd_bytes -= size
+            self._discard_pending(old_id)
+            expired.append(old_id)
+        return expired
+    
+    def _discard_pending(self, file_id: int):
+        # Lepas data file yang menunggu dan hapus file sementaranya
+        encrypted_data, self._pd_data[file_id] = self._pd_data[file_id], None
+        if encrypted_data is not None:
+            encrypted_data['encrypted_file'].discard()
     
-    def _on_download_file(self, file_id: str):
-        # Handle download file
-        if file_id not in self.pending_downloads:
+    def _on_download_file(self, file_id: int):
+        # Handle download file, disimpan lewat event loop
+        with self._pd_lock:
+            size = self._pd_live.pop(file_id, None)
+            if size is not None:
+                self._pd_bytes -= size
+        if size is None:
+            self.gui.expire_pending_file(file_id)
             self.gui.show_error("File tidak ditemukan!")
             return
-        file_info = self.pending_downloads[file_id]
-        
-        def download_thread():
+        asyncio.run_coroutine_threadsafe(self._download_file_async(file_id, size), self._loop)
+    
+    async def _download_file_async(self, file_id: int, size: int):
+        # Dekripsi dan tulis file di thread pool, hasilnya dikabarkan ke GUI
+        try:
+            save_path = await asyncio.to_thread(self._save_file, file_id)
+            self._discard_pending(file_id)
+            self._post(partial(self.gui.mark_file_downloaded, file_id, save_path))
+        except Exception as e:
+            # Data dikembalikan ke antrian supaya masih dihitung budget
+            with self._pd_lock:
+                self._pd_live[file_id] = size
+                self._pd_bytes += size
+            logger.warning("Error downloading file: %s", e)
+            self._post(partial(self.gui.reset_download_row, file_id))
+            self._post(partial(self.gui.show_error, f"Gagal menyimpan: {str(e)}"))
+    
+    def _save_file(self, file_id: int) -> str:
+        # Plaintext ditulis per chunk di dalam loop dekripsi, file setengah jadi dihapus kalau gagal
+        fd, save_path = self._open_unique(self._pd_save_path[file_id])
+        buf = self._buffers.acquire()
+        try:
+            self._write_chunks(fd, self.crypto.decrypt_file(self._pd_data[file_id], self._pd_peer[file_id], buf))
+        except Exception:
+            os.remove(save_path)
+            raise
+        finally:
+            self._buffers.release(buf)
+        return save_path
+    
+    def _pick_save_path(self, filename: str) -> str:
+        # Pilih path tujuan, kalau nama sudah dipakai tambahkan suffix acak
+        save_path = os.path.join(self.DOWNLOAD_DIR, filename)
+        if os.path.exists(save_path):
+            save_path = self._with_suffix(save_path)
+        return save_path
+    
+    def _with_suffix(self, save_path: str) -> str:
+        # Sisipkan suffix acak 6 hex sebelum ekstensi
+        name, ext = os.path.splitext(save_path)
+        return f"{name}_{secrets.token_hex(3)}{ext}"
+    
+    def _open_unique(self, save_path: str):
+        # Buat file baru secara atomik (O_EXCL), path yang keburu dipakai diganti suffix baru
+        flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0)
+        base = save_path
+        while True:
             try:
-                file_data = self.crypto.decrypt_file(
-                    file_info['encrypted_data'],
-                    file_info['peer_id']
-                )
-                
-                filename = file_info['filename']
-                save_path = os.path.join(self.DOWNLOAD_DIR, filename)
-                if os.path.exists(save_path):
-                    name, ext = os.path.splitext(filename)
-                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                    save_path = os.path.join(self.DOWNLOAD_DIR, f"{name}_{timestamp}{ext}")
-                
-                with open(save_path, 'wb') as f:
-                    f.write(file_data)
-                del self.pending_downloads[file_id]
-                self.gui.root.after(0, lambda: self.gui.mark_file_downloaded(file_id, save_path))
-
-            except Exception as e:
-                print(f"Error downloading file: {e}")
-                self.gui.root.after(0, lambda: self.gui.show_error(f"Gagal menyimpan: {str(e)}"))
-        
-        threading.Thread(target=download_thread, daemon=True).start()
+                return os.open(save_path, flags, 0o644), save_path
+            except FileExistsError:
+                save_path = self._with_suffix(base)
     
-    def _on_file_progress(self, peer_id: str, filename: str, progress: float):
-        # Handle progress transfer file
-        self.gui.root.after(0, lambda: self.gui.show_progress(filename, progress))
+    def _write_chunks(self, fd: int, chunks):
+        # Tulis chunk langsung lewat os.write (tanpa buffer Python), page cache dilepas setelah selesai
+        try:
+            for chunk in chunks:
+                view = memoryview(chunk)
+                while view:
+                    view = view[os.write(fd, view):]
+            if hasattr(os, 'posix_fadvise'):
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
     
     def _on_create_group(self, group_name: str, member_ids: list):
         # Handle create group
         try:
-            group_id = f"group_{uuid.uuid4().hex[:8]}"
-            group_key = self.crypto.create_group_key(group_id)
+            group_id = f"group_{secrets.token_hex(4)}"
+            # Group memakai AEAD yang didukung semua member
+            aead = self.crypto.common_aead(self.network.peer_aeads.get(pid) for pid in member_ids)
+            group_key = self.crypto.create_group_key(group_id, aead)
 
-            self.network.create_group(group_id, group_name, member_ids, group_key)
-            self.gui.root.after(0, lambda: self.gui.add_group(group_id, group_name))
-            self.gui.root.after(0, lambda: self.gui.add_system_message(
-                f"Group '{group_name}' berhasil dibuat!"
-            ))
+            self.network.create_group(group_id, group_name, member_ids, group_key, aead)
+            self._post(partial(self.gui.add_group, group_id, group_name))
+            self._post(partial(self.gui.add_system_message, f"Group '{group_name}' berhasil dibuat!"))
             
         except Exception as e:
-            self.gui.root.after(0, lambda: self.gui.show_error(f"Gagal membuat group: {str(e)}"))
+            self._post(partial(self.gui.show_error, f"Gagal membuat group: {str(e)}"))
     
-    def _on_group_invite_received(self, group_id: str, group_name: str, group_key: str, from_id: str):
+    def _on_group_invite_received(self, group_id: str, group_name: str, group_key: bytes, from_id: str):
         # Handle group invite received
         try:
-            self.crypto.set_group_key(group_id, group_key.encode('utf-8'))
-            self.gui.root.after(0, lambda: self.gui.add_group(group_id, group_name))
-            self.gui.root.after(0, lambda: self.gui.add_system_message(
-                f"Diundang ke group '{group_name}'!"
-            ))
+            self.crypto.set_group_key(group_id, group_key, self.network.groups[group_id].aead)
+            self._post(partial(self.gui.add_group, group_id, group_name))
+            self._post(partial(self.gui.add_system_message, f"Diundang ke group '{group_name}'!"))
             
         except Exception as e:
-            print(f"Error handling group invite: {e}")
+            logger.warning("Error handling group invite: %s", e)
     
     def _on_send_group_message(self, group_id: str, message: str):
         # Handle send group message
@@ -219,23 +447,19 @@ class P2PChatApp:
         except Exception as e:
             self.gui.show_error(f"Error: {str(e)}")
     
-    def _on_group_message_received(self, from_id: str, payload: dict):
-        # Handle group message received
+    async def _on_group_message_received(self, from_id: str, payload: dict):
+        # Handle group message received, dekripsi di thread pool
         try:
-            group_id = payload['group_id']
-            sender = payload['sender']
-            encrypted_data = payload['encrypted']
-            message = self.crypto.decrypt_group_message(encrypted_data, group_id)
-            self.gui.root.after(0, lambda: self.gui.add_group_message(
-                group_id, sender, message, is_sent=False
-            ))
+            group_id, sender, encrypted_data = payload['group_id'], payload['sender'], payload['encrypted']
+            message = await asyncio.to_thread(self.crypto.decrypt_group_message, encrypted_data, group_id)
+            self._post(partial(self.gui.add_group_message, group_id, sender, message, False))
             
         except Exception as e:
-            print(f"Error decrypting group message: {e}")
+            logger.warning("Error decrypting group message: %s", e)
     
     def start(self):
-        # Start app & Input username
-        root = tk.Tk()
+        # Start app & Input username, dialog memakai root GUI yang disembunyikan dulu (tanpa Tk kedua)
+        root = self.gui.root
         root.withdraw()
         username = simpledialog.askstring(
             "P2P Chat App",
@@ -243,29 +467,24 @@ class P2PChatApp:
             parent=root,
             initialvalue="user"
         )
-        root.destroy()
         if not username:
             username = "User"
         self.username = username
         
         # Input port
-        root = tk.Tk()
-        root.withdraw()
         port_str = simpledialog.askstring(
             "P2P Chat App",
             "Masukkan port untuk server peer anda:",
             parent=root,
             initialvalue="5000"
         )
-        root.destroy()
-        try:
-            port = int(port_str) if port_str else 5050
-        except ValueError:
-            port = 5050
+        root.deiconify()
+        port = int(port_str) if port_str and port_str.isdecimal() else 5050
         
         # Inisialiasi network
         ip = get_local_ip()
         self.network = P2PNode(ip, port, username)
+        self.network.aead_alg = self.crypto.aead_alg
         self._setup_network_callbacks()
         
         # Start node
@@ -281,17 +500,38 @@ class P2PChatApp:
         
         # Handle window close
         def on_closing():
+            self._closing.set()
             if self.network:
                 self.network.stop()
+            with self._pd_lock:
+                for file_id in self._pd_live:
+                    self._discard_pending(file_id)
+            self._loop.call_soon_threadsafe(self._discard_queued)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._io_pool.shutdown(wait=False, cancel_futures=True)
             self.gui.close()
         self.gui.root.protocol("WM_DELETE_WINDOW", on_closing)
 
         self.gui.run()
 
+def setup_logging():
+    # Log ditulis ke stderr oleh thread QueueListener, thread pemanggil cukup masuk antrian
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.setFormatter(logging.Formatter("[%(levelname)s] %(message)s"))
+    listener = logging.handlers.QueueListener(log_queue, logging.StreamHandler())
+    logging.basicConfig(level=logging.INFO, handlers=[queue_handler])
+    listener.start()
+    return listener
+
 def main():
     # Entry point
-    app = P2PChatApp()
-    app.start()
+    listener = setup_logging()
+    try:
+        app = P2PChatApp()
+        app.start()
+    finally:
+        listener.stop()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
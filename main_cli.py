@@ -1,8 +1,8 @@
-import uuid
-import socket
-from datetime import datetime
+import secrets
+import sys
+import time
 from crypto import CryptoManager
-from network import P2PNode
+from network import P2PNode, get_local_ip
 
 class P2PChatCLI:
     # Versi CLI untuk di tes di hp (kepo aja si ini hehe)
@@ -13,28 +13,28 @@ class P2PChatCLI:
         self.current_peer = None
         self.current_group = None
         self.username = ""
+        # Prefix jam log hanya diformat ulang saat menit berganti
+        self._last_minute = -1
+        self._last_prefix = ""
+        self._gname_cache = {}  # gid -> nama group untuk ditampilkan
     
     def log(self, msg, icon="📌"):
-        print(f"[{datetime.now().strftime('%H:%M')}] {icon} {msg}")
-    
-    def get_ip(self):
-        try:
-            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            s.connect(("8.8.8.8", 80))
-            ip = s.getsockname()[0]
-            s.close()
-            return ip
-        except:
-            return "127.0.0.1"
+        # Satu kali write per baris supaya log dari thread network tidak tercampur
+        now = time.time()
+        minute = int(now // 60)
+        if minute != self._last_minute:
+            self._last_minute = minute
+            self._last_prefix = time.strftime('%H:%M', time.localtime(now))
+        sys.stdout.write(f"[{self._last_prefix}] {icon} {msg}\n")
     
     def setup_callbacks(self):
         self.network.on_peer_connected = lambda pid, user: (
-            self.network.send_public_key(pid, self.crypto.get_public_key()),
+            self.network.send_public_key(pid, self.crypto.get_public_key_bytes()),
             self.log(f"{user} terhubung")
         )
         self.network.on_peer_disconnected = lambda pid, user: self.log(f"{user} terputus")
         self.network.on_public_key_received = lambda pid, key: (
-            self.crypto.import_peer_public_key(pid, key),
+            self.crypto.import_peer_public_key(pid, key, self.network.peer_aeads.get(pid)),
             self.log(f"Kunci dari {self.network.get_peer_username(pid)}", "🔐")
         )
         self.network.on_message_received = lambda pid, data: self.log(
@@ -44,7 +44,8 @@ class P2PChatCLI:
         self.network.on_group_message_received = self.handle_group_msg
     
     def handle_group_invite(self, gid, name, key, from_id):
-        self.crypto.set_group_key(gid, key.encode('utf-8'))
+        self.crypto.set_group_key(gid, key, self.network.groups[gid].aead)
+        self._gname_cache[gid] = name
         self.log(f"Diundang ke group '{name}'", "👥")
     
     def handle_group_msg(self, from_id, payload):
@@ -52,8 +53,7 @@ class P2PChatCLI:
             gid = payload['group_id']
             sender = payload['sender']
             msg = self.crypto.decrypt_group_message(payload['encrypted'], gid)
-            gname = self.network.groups.get(gid)
-            gname = gname.name if gname else gid[:8]
+            gname = self._gname_cache.get(gid) or gid[:8]
             self.log(f"[{gname}] {sender}: {msg}", "👥")
         except Exception as e:
             self.log(f"Error: {e}")
@@ -70,12 +70,12 @@ class P2PChatCLI:
             return self.log("Tidak punya key group ini!")
         enc = self.crypto.encrypt_group_message(msg, gid)
         self.network.send_group_message(gid, enc, self.username)
-        gname = self.network.groups.get(gid)
-        gname = gname.name if gname else gid[:8]
+        gname = self._gname_cache.get(gid) or gid[:8]
         self.log(f"[{gname}] You: {msg}", "📤")
     
     def create_group(self):
-        peers = self.network.get_connected_peers()
+        # Snapshot sekali supaya nomor yang ditampilkan sama dengan yang dipilih
+        peers = list(self.network.get_connected_peers().items())
         if not peers:
             return self.log("Tidak ada peer!")
         
@@ -84,11 +84,11 @@ class P2PChatCLI:
             return
         
         print("Pilih member (pisah koma, misal: 1,2):")
-        for i, (pid, user) in enumerate(peers.items(), 1):
+        for i, (pid, user) in enumerate(peers, 1):
             print(f"  {i}. {user}")
         
         nums = input("Member: ").strip().split(",")
-        pids = list(peers.keys())
+        pids = [pid for pid, _ in peers]
         members = []
         for n in nums:
             try:
@@ -101,9 +101,11 @@ class P2PChatCLI:
         if not members:
             return self.log("Pilih minimal 1 member!")
         
-        gid = f"group_{uuid.uuid4().hex[:8]}"
-        key = self.crypto.create_group_key(gid)
-        self.network.create_group(gid, name, members, key)
+        gid = f"group_{secrets.token_hex(4)}"
+        aead = self.crypto.common_aead(self.network.peer_aeads.get(pid) for pid in members)
+        key = self.crypto.create_group_key(gid, aead)
+        self.network.create_group(gid, name, members, key, aead)
+        self._gname_cache[gid] = name
         self.log(f"Group '{name}' dibuat!")
     
     def show_menu(self):
@@ -126,8 +128,9 @@ class P2PChatCLI:
         self.username = input("Username: ").strip() or "User"
         port = int(input("Port (5000): ").strip() or "5000")
         
-        ip = self.get_ip()
+        ip = get_local_ip()
         self.network = P2PNode(ip, port, self.username)
+        self.network.aead_alg = self.crypto.aead_alg
         self.network.debug = False
         self.setup_callbacks()
         
@@ -152,7 +155,7 @@ class P2PChatCLI:
                     peers = self.network.get_connected_peers()
                     if not peers:
                         print("  Tidak ada peer.")
-                    for i, (pid, user) in enumerate(peers.items(), 1):
+                    for i, (pid, user) in enumerate(list(peers.items()), 1):
                         mark = " *" if pid == self.current_peer else ""
                         print(f"  {i}. {user}{mark}")
                 
@@ -1,13 +1,28 @@
-import json
+import base64
+import functools
+import itertools
 import os
+import secrets
 import socket
+import struct
+import tempfile
+import threading
+import time
+import types
 from typing import Callable, Optional
+from collections import OrderedDict, deque
 from dataclasses import dataclass, field
 from enum import Enum
+import msgpack
 from p2pnetwork.node import Node
+from p2pnetwork.nodeconnection import NodeConnection
+from crypto import AEAD_TAG_SIZE
 
+_FRAME_HEADER = struct.Struct('>I')  # Panjang frame, 4 byte big-endian
+
+@functools.lru_cache(maxsize=1)
 def get_local_ip() -> str:
-        # Dapetin local IP
+        # Dapetin local IP, hasilnya di-cache selama proses berjalan
         try:
             s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
             s.connect(("8.8.8.8", 80))  
@@ -26,10 +41,128 @@ class MessageType(Enum):
     FILE_START = "file_start"
     FILE_CHUNK = "file_chunk"
     FILE_END = "file_end"
+    FILE_BATCH = "file_batch"
     DISCONNECT = "disconnect"
     GROUP_INVITE = "group_invite"
     GROUP_MESSAGE = "group_message"
     GROUP_JOIN = "group_join"
+    GROUP_RELAY_MISS = "group_relay_miss"
+
+
+class FramedConnection(NodeConnection):
+    # Koneksi dengan frame [panjang 4 byte][msgpack], menggantikan framing EOT + JSON bawaan p2pnetwork
+    RECV_SIZE = 262144
+    MAX_FRAME = 16 * 1024 * 1024  # Frame lebih besar dari ini dianggap rusak
+    SCATTER_MIN = 65536  # Frame sebesar ini dikirim dengan sendmsg tanpa menyalin ke header
+    
+    def __init__(self, main_node, sock, id, host, port):
+        super(FramedConnection, self).__init__(main_node, sock, id, host, port)
+        # Satu frame harus terkirim utuh sebelum frame lain dari thread lain
+        self._send_lock = threading.Lock()
+        # Tiap frame ditulis utuh sekali jalan, jadi Nagle hanya menambah delay untuk frame kecil
+        try:
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except OSError:
+            pass
+        self._scatter = hasattr(self.sock, 'sendmsg')
+        self.handshake_sent = False
+    
+    def send(self, data, encoding_type='utf-8', compression='none'):
+        # Kirim satu frame, dict di-pack dulu dengan serializer node; list = potongan frame yang disambung
+        if isinstance(data, dict):
+            data = self.main_node.dumps(data)
+        elif isinstance(data, str):
+            data = data.encode(encoding_type)
+        try:
+            if isinstance(data, list):
+                size = sum(len(part) for part in data)
+                with self._send_lock:
+                    if self._scatter:
+                        self._sendmsg_all([_FRAME_HEADER.pack(size)] + data)
+                    else:
+                        self.sock.sendall(b''.join([_FRAME_HEADER.pack(size)] + data))
+                return
+            with self._send_lock:
+                if self._scatter and len(data) >= self.SCATTER_MIN:
+                    self._sendmsg_all([_FRAME_HEADER.pack(len(data)), data])
+                else:
+                    self.sock.sendall(_FRAME_HEADER.pack(len(data)) + data)
+        except Exception as e:
+            self.main_node.debug_print(f"FramedConnection send: Error sending data to node: {e}")
+            self.stop()
+    
+    def _sendmsg_all(self, buffers: list):
+        # Kirim beberapa buffer dengan sendmsg (scatter/gather) sampai habis, sisa kiriman parsial diulang
+        views = [memoryview(buf) for buf in buffers]
+        while views:
+            sent = self.sock.sendmsg(views)
+            while views and sent >= len(views[0]):
+                sent -= len(views[0])
+                views.pop(0)
+            if sent:
+                views[0] = views[0][sent:]
+
+    def run(self):
+        # Baca stream lalu potong per frame sesuai panjangnya, tanpa jeda sleep antar recv
+        buffer = bytearray()
+        header_size = _FRAME_HEADER.size
+        while not self.terminate_flag.is_set():
+            try:
+                chunk = self.sock.recv(self.RECV_SIZE)
+            except socket.timeout:
+                continue
+            except Exception as e:
+                self.main_node.debug_print(f"FramedConnection: {e}")
+                break
+            if not chunk:
+                break  # Socket ditutup peer
+            
+            buffer += chunk
+            while len(buffer) >= header_size:
+                (size,) = _FRAME_HEADER.unpack_from(buffer)
+                if size > self.MAX_FRAME:
+                    self.main_node.debug_print(f"FramedConnection: frame terlalu besar ({size})")
+                    self.terminate_flag.set()
+                    break
+                end = header_size + size
+                if len(buffer) < end:
+                    break
+                packet = bytes(buffer[header_size:end])
+                del buffer[:end]
+                self.main_node.message_count_recv += 1
+                try:
+                    message = self.main_node.loads(packet)
+                except Exception as e:
+                    self.main_node.debug_print(f"FramedConnection: frame tidak valid: {e}")
+                    continue
+                self.main_node.node_message(self, message)
+        
+        self.terminate_flag.set()
+        self.sock.settimeout(None)
+        self.sock.close()
+        self.main_node.node_disconnected(self)
+
+
+class ReceivedFile:
+    # Ciphertext file yang sudah diterima, disimpan di file sementara; iterasi menghasilkan chunk satu per satu
+    def __init__(self, path: str, ends: list):
+        self.path = path
+        self.ends = ends  # offset akhir tiap chunk
+
+    def __iter__(self):
+        # Baca chunk berurutan dari file sementara
+        with open(self.path, 'rb', buffering=0) as f:
+            start = 0
+            for end in self.ends:
+                yield f.read(end - start)
+                start = end
+
+    def discard(self):
+        # Hapus file sementara
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
 
 
 @dataclass
@@ -38,19 +171,47 @@ class Group:
     name: str
     creator_id: str
     members: list = field(default_factory=list) 
+    aead: Optional[str] = None
+    id_table: tuple = ()  # Urutan member saat invite, sama di semua member; indeks bit untuk relay_bits
 
 
 class P2PNode(Node):
     # P2P Node menggunakan library python-p2p-network 
-    CHUNK_SIZE = 32768  
+    CHUNK_SIZE = 262144  # Ukuran plaintext per chunk file
+    FILE_BATCH = 4  # Jumlah chunk yang digabung dalam satu frame FILE_BATCH
+    GROUP_FANOUT = 2  # Jumlah cabang yang dikirimi langsung saat fan-out pesan group
+    SEEN_GROUP_MESSAGES = 256  # Jumlah msg_id group terakhir yang diingat untuk buang duplikat
+    CAPS = ('member_bitmap',)  # Fitur opsional yang kita dukung, dikirim saat handshake
+    PROGRESS_INTERVAL = 0.25  # Detik minimum antar callback progress kalau persennya belum berubah
+    # Serializer frame (msgpack, bytes dikirim sebagai bin tanpa base64)
+    dumps = staticmethod(functools.partial(msgpack.packb, use_bin_type=True))
+    loads = staticmethod(functools.partial(msgpack.unpackb, raw=False))
+    # Awal frame {'type': ..., 'payload': ...} per tipe yang sudah di-pack, tinggal disambung payload
+    _FRAME_PREFIXES = {
+        t.value: b'\x82' + msgpack.packb('type') + msgpack.packb(t.value) + msgpack.packb('payload')
+        for t in MessageType
+    }
     
     def __init__(self, host: str, port: int, username: str, id=None, max_connections=0):
         super(P2PNode, self).__init__(host, port, id, None, max_connections)
         self.debug = False 
         self.username = username
         self.peer_usernames = {}  
+        self._peers_view = types.MappingProxyType(self.peer_usernames)
+        self.aead_alg = None  # AEAD pilihan kita, diisi aplikasi dan dikirim saat handshake
+        self.peer_aeads = {}  # peer_id -> AEAD pilihan peer dari handshake
+        self.peer_caps = {}  # peer_id -> fitur opsional yang didukung peer (CAPS dari handshake)
         self.groups = {}  
-        self.receiving_files = {}
+        self.receiving_files = {}  # (peer_id, file_id) -> info file yang sedang diterima (ditulis ke file sementara)
+        self.sending_files = {}  # (peer_id, file_id) -> info file yang sedang dikirim
+        self._nodes_by_id = {}  # node_id -> koneksi, diisi saat connect dan dihapus saat disconnect
+        self._seen_order = deque()
+        self._seen_ids = set()
+        self._seen_lock = threading.Lock()
+        self._relay_pending = OrderedDict()  # msg_id -> pesan group kita yang sebagian dititipkan ke relay
+        self._relay_lock = threading.Lock()
+        self._handshake_lock = threading.Lock()
+        self._file_ids = itertools.count()
         # Callbacks
         self.on_message_received: Optional[Callable] = None
         self.on_file_received: Optional[Callable] = None
@@ -60,56 +221,147 @@ class P2PNode(Node):
         self.on_file_progress: Optional[Callable] = None
         self.on_group_invite_received: Optional[Callable] = None
         self.on_group_message_received: Optional[Callable] = None
+        # Handler per tipe pesan, dicari langsung dari string 'type' tanpa membuat Enum
+        self._dispatch = {
+            MessageType.HANDSHAKE.value: self._handle_handshake,
+            MessageType.PUBLIC_KEY.value: self._handle_public_key,
+            MessageType.CHAT.value: self._handle_chat,
+            MessageType.FILE_START.value: self._handle_file_start,
+            MessageType.FILE_CHUNK.value: self._handle_file_chunk,
+            MessageType.FILE_BATCH.value: self._handle_file_batch,
+            MessageType.FILE_END.value: self._handle_file_end,
+            MessageType.GROUP_INVITE.value: self._handle_group_invite,
+            MessageType.GROUP_MESSAGE.value: self._handle_group_message,
+            MessageType.GROUP_JOIN.value: self._handle_group_join,
+            MessageType.GROUP_RELAY_MISS.value: self._handle_group_relay_miss,
+        }
     
     def _handle_disconnect(self, node):
         # Handle disconnect peer
+        if self._nodes_by_id.get(node.id) is node:
+            del self._nodes_by_id[node.id]
         username = self.peer_usernames.get(node.id, "Unknown")
         if node.id in self.peer_usernames:
             del self.peer_usernames[node.id]
+        self.peer_aeads.pop(node.id, None)
+        self.peer_caps.pop(node.id, None)
+        # Transfer yang belum selesai dari peer ini dibuang
+        for key in [key for key in self.receiving_files if key[0] == node.id]:
+            self._abort_receive(key)
         if self.on_peer_disconnected:
             self.on_peer_disconnected(node.id, username)
     
-    def _handle_handshake(self, node, payload):
+    def _handle_handshake(self, peer_id, payload):
         # Handle handshake message
         username = payload.get('username', 'Unknown')
-        self.peer_usernames[node.id] = username
+        self.peer_usernames[peer_id] = username
+        self.peer_aeads[peer_id] = payload.get('aead')
+        self.peer_caps[peer_id] = frozenset(payload.get('caps', ()))
+        # Koneksi masuk baru membalas handshake setelah handshake peer datang, lihat inbound_node_connected
+        node = self._nodes_by_id.get(peer_id)
+        if node is not None:
+            self._send_handshake(node)
         if self.on_peer_connected:
-            self.on_peer_connected(node.id, username)
+            self.on_peer_connected(peer_id, username)
+    
+    def _handle_public_key(self, peer_id, payload):
+        # Handle public key dari peer
+        if self.on_public_key_received:
+            public_key = payload['public_key']
+            if isinstance(public_key, str):
+                public_key = public_key.encode('utf-8')
+            self.on_public_key_received(peer_id, public_key)
+    
+    def _handle_chat(self, peer_id, payload):
+        # Handle pesan chat terenkripsi
+        if self.on_message_received:
+            self.on_message_received(peer_id, payload)
     
     def _handle_file_start(self, peer_id, payload):
-        # Handle transfer file persiapan
-        self.receiving_files[peer_id] = {
-            'filename': payload['filename'],
+        # Handle transfer file persiapan, nama file dipotong ke basename sekali di sini
+        key = (peer_id, payload.get('file_id'))
+        if key in self.receiving_files:
+            self._abort_receive(key)
+        fd, path = tempfile.mkstemp(prefix='p2p-rx-')
+        chunk_count = payload.get('chunk_count', 1)
+        self.receiving_files[key] = {
+            'filename': os.path.basename(payload['filename']),
             'filesize': payload['filesize'],
-            'chunks': [],
-            'received': 0,
+            'chunk_count': chunk_count,
+            # Ciphertext tidak boleh melebihi ukuran yang diumumkan ditambah tag tiap chunk
+            'max_size': payload['filesize'] + chunk_count * AEAD_TAG_SIZE,
+            'fp': os.fdopen(fd, 'wb'),
+            'path': path,
+            'size': 0,
+            'ends': [],  # offset akhir tiap chunk di file sementara
             'nonce': payload['nonce']
         }
     
+    def _abort_receive(self, key):
+        # Batalkan transfer yang sedang diterima dan hapus file sementaranya
+        file_info = self.receiving_files.pop(key, None)
+        if file_info:
+            file_info['fp'].close()
+            ReceivedFile(file_info['path'], []).discard()
+    
     def _handle_file_chunk(self, peer_id, payload):
-        # Handle streaming chunk file
-        if peer_id in self.receiving_files:
-            file_info = self.receiving_files[peer_id]
-            file_info['chunks'].append(payload['data'])
-            file_info['received'] += len(payload['data'])
+        # Handle streaming chunk file, ciphertext langsung ditulis ke file sementara
+        key = (peer_id, payload.get('file_id'))
+        file_info = self.receiving_files.get(key)
+        if file_info:
+            ends = file_info['ends']
+            if payload.get('seq', len(ends)) != len(ends):
+                print(f"Chunk file {file_info['filename']} tidak berurutan, transfer dibatalkan")
+                self._abort_receive(key)
+                return
+            data = payload['data']
+            # Ciphertext datang sebagai bin msgpack, string berarti masih base64
+            if isinstance(data, str):
+                data = base64.b64decode(data)
+            if file_info['size'] + len(data) > file_info['max_size']:
+                print(f"File {file_info['filename']} melebihi ukuran yang diumumkan, transfer dibatalkan")
+                self._abort_receive(key)
+                return
+            file_info['fp'].write(data)
+            file_info['size'] += len(data)
+            ends.append(file_info['size'])
             
-            if self.on_file_progress:
-                progress = (file_info['received'] / file_info['filesize']) * 100
-                self.on_file_progress(peer_id, file_info['filename'], progress)
+            self._report_progress(peer_id, file_info, len(ends))
+    
+    def _report_progress(self, peer_id: str, file_info: dict, done: int):
+        # Panggil on_file_progress hanya kalau persen bulatnya berubah atau sudah lewat PROGRESS_INTERVAL
+        if not self.on_file_progress:
+            return
+        progress = min(100, (done / file_info['chunk_count']) * 100)
+        now = time.monotonic()
+        if int(progress) == file_info.get('progress_pct') and now - file_info.get('progress_at', 0) < self.PROGRESS_INTERVAL:
+            return
+        file_info['progress_pct'] = int(progress)
+        file_info['progress_at'] = now
+        self.on_file_progress(peer_id, file_info['filename'], progress)
+
+    def _handle_file_batch(self, peer_id, payload):
+        # Handle beberapa chunk file sekaligus dalam satu frame
+        file_id, seq = payload.get('file_id'), payload.get('seq', 0)
+        for offset, data in enumerate(payload['chunks']):
+            self._handle_file_chunk(peer_id, {'file_id': file_id, 'seq': seq + offset, 'data': data})
     
     def _handle_file_end(self, peer_id, payload):
         # Handle transfer file akhir
-        if peer_id in self.receiving_files:
-            file_info = self.receiving_files[peer_id]
+        file_info = self.receiving_files.pop((peer_id, payload.get('file_id')), None)
+        if file_info:
+            file_info['fp'].close()
             encrypted_data = {
-                'encrypted_file': ''.join(file_info['chunks']),
-                'nonce': file_info['nonce']
+                'encrypted_file': ReceivedFile(file_info['path'], file_info['ends']),
+                'nonce': file_info['nonce'],
+                'filesize': file_info['filesize'],
+                'size': file_info['size']  # Byte yang benar-benar ada di file sementara
             }
             
             if self.on_file_received:
                 self.on_file_received(peer_id, file_info['filename'], encrypted_data)
-            
-            del self.receiving_files[peer_id]
+            else:
+                encrypted_data['encrypted_file'].discard()
     
     def _handle_group_invite(self, from_id, payload):
         # Handle group invitation
@@ -117,23 +369,117 @@ class P2PNode(Node):
         group_name = payload['group_name']
         creator_id = payload['creator_id']
         group_key = payload['group_key']
+        if isinstance(group_key, str):
+            group_key = group_key.encode('utf-8')
         members = payload.get('members', [])
         
         self.groups[group_id] = Group(
             group_id=group_id,
             name=group_name,
             creator_id=creator_id,
-            members=members
+            members=members,
+            aead=payload.get('aead'),
+            id_table=tuple(members)
         )
         
         if self.on_group_invite_received:
             self.on_group_invite_received(group_id, group_name, group_key, from_id)
     
     def _handle_group_message(self, from_id, payload):
-        # Handle pesan group
-        if self.on_group_message_received:
+        # Handle pesan group, lalu teruskan ke member yang dititipkan ke kita
+        msg_id = payload.get('msg_id')
+        # Pesan yang sudah diterima tetap diproses relay-nya (titipan ulang dari pengirim), tapi tidak ditampilkan lagi
+        first = msg_id is None or self._mark_seen(msg_id)
+        relay = payload.pop('relay', None) or []
+        relay_bits = payload.pop('relay_bits', None)
+        # Titipan hanya dilayani dari member group dan hanya ke member lain, supaya peer luar tidak bisa
+        # memakai kita untuk menyebar frame ke semua koneksi
+        group = self.groups.get(payload.get('group_id'))
+        if (relay or relay_bits) and group and from_id in group.members:
+            if relay_bits:
+                relay = self._decode_relay(relay_bits, group.id_table) + relay
+            allowed = set(group.members) - {self.id, from_id}
+            relay = [member_id for member_id in relay if member_id in allowed]
+            if relay:
+                self._deliver_relay(from_id, payload, relay)
+        elif relay_bits and group is None:
+            # Bitmap tidak bisa dibaca tanpa id_table group: kembalikan seluruh titipan ke pengirim
+            origin = self._nodes_by_id.get(from_id)
+            if origin:
+                self._send_raw(origin, self._frame(MessageType.GROUP_RELAY_MISS.value, {
+                    'msg_id': msg_id,
+                    'group_id': payload.get('group_id'),
+                    'missed': relay,
+                    'missed_bits': relay_bits
+                }))
+        if first and self.on_group_message_received:
             self.on_group_message_received(from_id, payload)
     
+    def _deliver_relay(self, from_id, payload: dict, relay: list):
+        # Kirim langsung ke member titipan yang terhubung ke kita (tanpa relay lagi, jadi tidak ada loop),
+        # yang tidak terjangkau dilaporkan balik ke pengirim
+        nodes = self._nodes_by_id
+        frame = None
+        missed = []
+        for member_id in relay:
+            node = nodes.get(member_id)
+            if node is None:
+                missed.append(member_id)
+                continue
+            if frame is None:
+                frame = self._frame(MessageType.GROUP_MESSAGE.value, payload)
+            self._send_raw(node, frame)
+        origin = nodes.get(from_id)
+        if missed and origin:
+            self._send_raw(origin, self._frame(MessageType.GROUP_RELAY_MISS.value, {
+                'msg_id': payload.get('msg_id'),
+                'group_id': payload.get('group_id'),
+                'missed': missed
+            }))
+    
+    def _handle_group_relay_miss(self, from_id, payload):
+        # Head tidak bisa menjangkau sebagian member: yang terhubung ke kita dikirim langsung,
+        # sisanya dicoba lewat member terhubung lain yang belum pernah jadi head
+        group_id = payload.get('group_id')
+        nodes = self._nodes_by_id
+        with self._relay_lock:
+            pending = self._relay_pending.get(payload.get('msg_id'))
+            if not pending or from_id not in pending['tried']:
+                return
+            missed = list(payload.get('missed', []))
+            group = self.groups.get(group_id)
+            if payload.get('missed_bits') and group:
+                missed += self._decode_relay(payload['missed_bits'], group.id_table)
+            missed = [member_id for member_id in missed if member_id in pending['targets']]
+            direct = [member_id for member_id in missed if member_id in nodes]
+            missed = [member_id for member_id in missed if member_id not in nodes]
+            head = None
+            if missed:
+                for member_id in pending['candidates']:
+                    if member_id not in pending['tried'] and member_id in nodes:
+                        head = member_id
+                        pending['tried'].add(head)
+                        break
+        if direct:
+            frame = self._frame(MessageType.GROUP_MESSAGE.value, pending['payload'])
+            for member_id in direct:
+                node = nodes.get(member_id)
+                if node:
+                    self._send_raw(node, frame)
+        if missed and (head is None or not self._send_relay(head, pending['payload'], missed)):
+            print(f"Pesan group {group_id} tidak sampai ke {len(missed)} member (tidak ada jalur relay)")
+    
+    def _mark_seen(self, msg_id: str) -> bool:
+        # Catat msg_id group, False kalau sudah pernah diterima
+        with self._seen_lock:
+            if msg_id in self._seen_ids:
+                return False
+            self._seen_ids.add(msg_id)
+            self._seen_order.append(msg_id)
+            if len(self._seen_order) > self.SEEN_GROUP_MESSAGES:
+                self._seen_ids.discard(self._seen_order.popleft())
+            return True
+    
     def _handle_group_join(self, from_id, payload):
         # Handle ketika ada yang join group
         group_id = payload['group_id']
@@ -142,18 +488,25 @@ class P2PNode(Node):
                 self.groups[group_id].members.append(from_id)
 
     def outbound_node_connected(self, node):
-        # Handle koneksi ke node lain
-        self.send_to_node(node, {
-            'type': MessageType.HANDSHAKE.value,
-            'payload': {'username': self.username}
-        })
+        # Handle koneksi ke node lain, kita yang mengirim handshake duluan
+        self._nodes_by_id[node.id] = node
+        self._send_handshake(node)
+    
+    def _send_handshake(self, node):
+        # Kirim username dan kemampuan kita ke peer, sekali per koneksi
+        with self._handshake_lock:
+            if getattr(node, 'handshake_sent', False):
+                return
+            node.handshake_sent = True
+        # Langsung ke koneksi: send_to_node membuang frame kalau node belum masuk nodes_inbound
+        self._send_raw(node, self._frame(MessageType.HANDSHAKE.value, {
+            'username': self.username, 'aead': self.aead_alg, 'caps': self.CAPS
+        }))
     
     def inbound_node_connected(self, node):
-        # Handle koneksi peer lain ke kita
-        self.send_to_node(node, {
-            'type': MessageType.HANDSHAKE.value,
-            'payload': {'username': self.username}
-        })
+        # Handle koneksi peer lain ke kita. Handshake belum dikirim: peer masih membaca id kita dengan
+        # recv mentah, frame yang menyusul terlalu cepat bisa ikut terbaca dan koneksinya gagal
+        self._nodes_by_id[node.id] = node
     
     def inbound_node_disconnected(self, node):
         self._handle_disconnect(node)
@@ -164,153 +517,257 @@ class P2PNode(Node):
     def node_message(self, node, data):
         # Handle penerimaan pesan
         try:
-            if isinstance(data, str):
-                data = json.loads(data)
-            
-            msg_type = MessageType(data.get('type'))
-            payload = data.get('payload', {})
-            
-            if msg_type == MessageType.HANDSHAKE:
-                self._handle_handshake(node, payload)
-            elif msg_type == MessageType.PUBLIC_KEY:
-                if self.on_public_key_received:
-                    self.on_public_key_received(node.id, payload['public_key'].encode('utf-8'))
-            elif msg_type == MessageType.CHAT:
-                if self.on_message_received:
-                    self.on_message_received(node.id, payload)
-            elif msg_type == MessageType.FILE_START:
-                self._handle_file_start(node.id, payload)
-            elif msg_type == MessageType.FILE_CHUNK:
-                self._handle_file_chunk(node.id, payload)
-            elif msg_type == MessageType.FILE_END:
-                self._handle_file_end(node.id, payload)
-            elif msg_type == MessageType.GROUP_INVITE:
-                self._handle_group_invite(node.id, payload)
-            elif msg_type == MessageType.GROUP_MESSAGE:
-                self._handle_group_message(node.id, payload)
-            elif msg_type == MessageType.GROUP_JOIN:
-                self._handle_group_join(node.id, payload)
-                
+            handler = self._dispatch.get(data.get('type'))
+            if handler:
+                handler(node.id, data.get('payload', {}))
         except Exception as e:
             print(f"Error processing message: {e}")
     
     # =====> Send Method 
     
+    def create_new_connection(self, connection, id, host, port):
+        # Semua koneksi memakai framing panjang + msgpack. Didaftarkan sebelum thread-nya jalan,
+        # karena handshake peer bisa diproses sebelum inbound_node_connected dipanggil
+        node = FramedConnection(self, connection, id, host, port)
+        self._nodes_by_id[id] = node
+        return node
+    
     def send_public_key(self, node_id: str, public_key: bytes):
-        # Kirim public key ke peer
+        # Kirim public key ke peer, bytes dikirim langsung sebagai bin msgpack
         node = self.get_node_by_id(node_id)
         if node:
             self.send_to_node(node, {
                 'type': MessageType.PUBLIC_KEY.value,
-                'payload': {'public_key': public_key.decode('utf-8')}
+                'payload': {'public_key': public_key}
             })
     
     def send_chat(self, node_id: str, encrypted_data: dict) -> bool:
         # Kirim pesan chat terenkripsi
         node = self.get_node_by_id(node_id)
         if node:
-            self.send_to_node(node, {
-                'type': MessageType.CHAT.value,
-                'payload': encrypted_data
-            })
+            self._send_raw(node, self._frame(MessageType.CHAT.value, encrypted_data))
             return True
         return False
     
-    def send_file(self, node_id: str, filename: str, encrypted_data: dict):
-        # Kirim file terenkripsi dalam chunks
+    def send_file(self, node_id: str, filename: str, encrypted_data: dict, filesize: int):
+        # Kirim file terenkripsi, tiap chunk ciphertext langsung dikirim begitu selesai dienkripsi
+        file_id = self.send_file_start(node_id, filename, filesize, encrypted_data['nonce'])
+        if file_id is None:
+            return
+        for chunk in encrypted_data['encrypted_file']:
+            self.send_file_chunk(node_id, file_id, chunk)
+        self.send_file_end(node_id, file_id)
+    
+    def send_file_start(self, node_id: str, filename: str, filesize: int, nonce: str) -> Optional[int]:
+        # Mulai transfer file, return file_id transfer (None kalau peer tidak terhubung)
         node = self.get_node_by_id(node_id)
         if not node:
-            return
-        file_data = encrypted_data['encrypted_file']
-        filesize = len(file_data)
+            return None
+        file_id = next(self._file_ids)
+        filename = os.path.basename(filename)
+        chunk_count = max(1, -(-filesize // self.CHUNK_SIZE))
+        self.sending_files[(node_id, file_id)] = {
+            'node': node,
+            'filename': filename,
+            'chunk_count': chunk_count,
+            'seq': 0,  # seq chunk pertama di batch berikutnya
+            'batch': []
+        }
         
         self.send_to_node(node, {
             'type': MessageType.FILE_START.value,
             'payload': {
-                'filename': os.path.basename(filename),
+                'file_id': file_id,
+                'filename': filename,
                 'filesize': filesize,
-                'nonce': encrypted_data['nonce']
+                'chunk_count': chunk_count,
+                'nonce': nonce
             }
         })
+        return file_id
+    
+    def send_file_chunk(self, node_id: str, file_id: int, data: bytes):
+        # Tampung satu chunk ciphertext, dikirim per FILE_BATCH chunk dalam satu frame
+        file_info = self.sending_files[(node_id, file_id)]
+        file_info['batch'].append(data)
+        if len(file_info['batch']) >= self.FILE_BATCH:
+            self._flush_file_batch(node_id, file_id, file_info)
+    
+    def _flush_file_batch(self, node_id: str, file_id: int, file_info: dict):
+        # Kirim chunk yang tertampung sebagai satu frame, nomor urut (seq) diisi otomatis
+        batch = file_info['batch']
+        if not batch:
+            return
+        seq = file_info['seq']
+        file_info['seq'] = seq + len(batch)
+        file_info['batch'] = []
+        self._send_raw(file_info['node'], self._frame_file_batch(file_id, seq, batch))
         
-        for i in range(0, filesize, self.CHUNK_SIZE):
-            chunk = file_data[i:i + self.CHUNK_SIZE]
-            self.send_to_node(node, {
-                'type': MessageType.FILE_CHUNK.value,
-                'payload': {'data': chunk}
-            })
-            
-            if self.on_file_progress:
-                progress = min(100, ((i + len(chunk)) / filesize) * 100)
-                self.on_file_progress(node_id, filename, progress)
-        
-        self.send_to_node(node, {
+        self._report_progress(node_id, file_info, file_info['seq'])
+    
+    def send_file_end(self, node_id: str, file_id: int):
+        # Kirim sisa chunk lalu akhiri transfer file
+        file_info = self.sending_files.pop((node_id, file_id))
+        self._flush_file_batch(node_id, file_id, file_info)
+        self.send_to_node(file_info['node'], {
             'type': MessageType.FILE_END.value,
-            'payload': {}
+            'payload': {'file_id': file_id}
         })
     
     # =====> Group Method 
     
-    def create_group(self, group_id: str, group_name: str, member_ids: list, group_key: bytes):
+    def create_group(self, group_id: str, group_name: str, member_ids: list, group_key: bytes, aead: str = None):
         # membuat group baru dan invite member
         self.groups[group_id] = Group(
             group_id=group_id,
             name=group_name,
             creator_id=self.id,
-            members=[self.id] + member_ids
+            members=[self.id] + member_ids,
+            aead=aead,
+            id_table=tuple([self.id] + member_ids)
         )
         
+        # Undangan sama untuk semua member, diserialisasi sekali
+        frame = self._frame(MessageType.GROUP_INVITE.value, {
+            'group_id': group_id,
+            'group_name': group_name,
+            'creator_id': self.id,
+            'group_key': group_key,
+            'members': [self.id] + member_ids,
+            'aead': aead
+        })
         for member_id in member_ids:
             node = self.get_node_by_id(member_id)
             if node:
-                self.send_to_node(node, {
-                    'type': MessageType.GROUP_INVITE.value,
-                    'payload': {
-                        'group_id': group_id,
-                        'group_name': group_name,
-                        'creator_id': self.id,
-                        'group_key': group_key.decode('utf-8'),
-                        'members': [self.id] + member_ids
-                    }
-                })
+                self._send_raw(node, frame)
     
     def send_group_message(self, group_id: str, encrypted_data: dict, sender_username: str):
         # Send message ke semua member group
         if group_id not in self.groups:
             return False
         group = self.groups[group_id]
+        msg_id = secrets.token_hex(8)
+        self._mark_seen(msg_id)
         payload = {
+            'msg_id': msg_id,
             'group_id': group_id,
             'sender': sender_username,
             'encrypted': encrypted_data
         }
+        self._fan_out_group(payload, [member_id for member_id in group.members if member_id != self.id])
+        return True
+    
+    def _fan_out_group(self, payload: dict, targets: list):
+        # Upload pengirim O(GROUP_FANOUT): pesan hanya dikirim ke beberapa member terhubung (head),
+        # sisanya dititipkan ke head; member yang tidak bisa dijangkau head dilaporkan balik (GROUP_RELAY_MISS)
+        nodes = self._nodes_by_id
+        reachable = [member_id for member_id in targets if member_id in nodes]
+        if not reachable:
+            if targets:
+                print(f"Pesan group {payload.get('group_id')} tidak sampai ke {len(targets)} member (tidak ada jalur relay)")
+            return
+        fanout = min(self.GROUP_FANOUT, len(reachable))
+        heads = reachable[:fanout]
+        rest = reachable[fanout:] + [member_id for member_id in targets if member_id not in nodes]
         
-        for member_id in group.members:
-            if member_id != self.id:
-                node = self.get_node_by_id(member_id)
-                if node:
-                    self.send_to_node(node, {
-                        'type': MessageType.GROUP_MESSAGE.value,
-                        'payload': payload
-                    })
+        # Simpan pesan supaya titipan yang gagal bisa dikirim langsung atau lewat head lain
+        if rest:
+            with self._relay_lock:
+                self._relay_pending[payload['msg_id']] = {
+                    'payload': payload,
+                    'targets': set(rest),
+                    'candidates': reachable,
+                    'tried': set(heads)
+                }
+                if len(self._relay_pending) > self.SEEN_GROUP_MESSAGES:
+                    self._relay_pending.popitem(last=False)
+        for i, head in enumerate(heads):
+            self._send_relay(head, payload, rest[i::fanout])
+    
+    def _send_relay(self, head: str, payload: dict, relay: list) -> bool:
+        # Kirim pesan ke head beserta daftar member titipan; bitmap indeks id_table kalau head mendukungnya
+        node = self._nodes_by_id.get(head)
+        if node is None:
+            return False
+        group = self.groups.get(payload.get('group_id'))
+        index = None
+        if group and 'member_bitmap' in self.peer_caps.get(head, ()):
+            index = {member_id: i for i, member_id in enumerate(group.id_table)}
+        self._send_raw(node, self._frame(MessageType.GROUP_MESSAGE.value, {
+            **payload, **self._encode_relay(relay, index)
+        }))
         return True
     
+    def _encode_relay(self, relay: list, index: Optional[dict]) -> dict:
+        # Bit ke-i = id_table[i]; id di luar tabel (mis. join belakangan) tetap dikirim sebagai list
+        if not relay:
+            return {}
+        if not index:
+            return {'relay': relay}
+        bits = 0
+        extra = []
+        for member_id in relay:
+            i = index.get(member_id)
+            if i is None:
+                extra.append(member_id)
+            else:
+                bits |= 1 << i
+        fields = {'relay_bits': bits.to_bytes((len(index) + 7) // 8, 'big')}
+        if extra:
+            fields['relay'] = extra
+        return fields
+    
+    def _decode_relay(self, relay_bits: bytes, id_table: tuple) -> list:
+        # Kebalikan _encode_relay: ambil id member yang bitnya menyala
+        bits = int.from_bytes(relay_bits, 'big')
+        return [member_id for i, member_id in enumerate(id_table) if bits >> i & 1]
+    
     # =====> Utility Method 
     
+    def _frame(self, msg_type: str, payload) -> bytes:
+        # Serialisasi frame tanpa membuat dict luar; hasilnya sama persis dengan dumps({'type', 'payload'})
+        return self._FRAME_PREFIXES[msg_type] + self.dumps(payload)
+
+    def _frame_file_batch(self, file_id: int, seq: int, chunks: list) -> list:
+        # FILE_BATCH di-pack manual: hasilnya sama dengan _frame(), tapi chunk ciphertext tidak disalin,
+        # hanya diberi header bin msgpack lalu dikirim berurutan lewat sendmsg
+        pack = msgpack.packb
+        count = len(chunks)
+        head = (self._FRAME_PREFIXES[MessageType.FILE_BATCH.value] + b'\x83'
+                + pack('file_id') + pack(file_id) + pack('seq') + pack(seq) + pack('chunks')
+                + (bytes([0x90 | count]) if count < 16 else b'\xdc' + count.to_bytes(2, 'big')))
+        parts = []
+        for chunk in chunks:
+            size = len(chunk)
+            if size < 0x100:
+                head += b'\xc4' + size.to_bytes(1, 'big')
+            elif size < 0x10000:
+                head += b'\xc5' + size.to_bytes(2, 'big')
+            else:
+                head += b'\xc6' + size.to_bytes(4, 'big')
+            parts.append(head)
+            parts.append(chunk)
+            head = b''
+        if head:
+            parts.append(head)
+        return parts
+
+    def _send_raw(self, node, frame):
+        # Kirim frame yang sudah diserialisasi; node berasal dari _nodes_by_id jadi tidak perlu dicek ulang
+        self.message_count_send += 1
+        node.send(frame)
+    
     def get_node_by_id(self, node_id: str):
         # Get node dari id
-        for node in self.all_nodes:
-            if node.id == node_id:
-                return node
-        return None
+        return self._nodes_by_id.get(node_id)
     
     def get_peer_username(self, node_id: str) -> str:
         # Get username peer
         return self.peer_usernames.get(node_id, "Unknown")
     
-    def get_connected_peers(self) -> dict:
-        # Get semua conected peer
-        return self.peer_usernames.copy()
+    def get_connected_peers(self) -> types.MappingProxyType:
+        # Get semua conected peer, berupa view read-only (pakai dict(...) kalau perlu salinan)
+        return self._peers_view
     
     def connect_to_peer(self, host: str, port: int) -> bool:
         # Konek ke peer lain
@@ -0,0 +1,51 @@
+import os
+import sys
+import unittest
+
+import msgpack
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from network import MessageType, P2PNode
+
+
+class FileBatchFrameTest(unittest.TestCase):
+    # _frame_file_batch di-pack manual, hasilnya harus sama persis dengan msgpack.packb
+    def setUp(self):
+        self.node = P2PNode('127.0.0.1', 0, 'tx')
+
+    def tearDown(self):
+        self.node.sock.close()
+
+    def _expected(self, file_id, seq, chunks):
+        return msgpack.packb({
+            'type': MessageType.FILE_BATCH.value,
+            'payload': {'file_id': file_id, 'seq': seq, 'chunks': chunks}
+        }, use_bin_type=True)
+
+    def test_matches_packb_for_1_to_20_chunks(self):
+        sizes = [0, 1, 255, 256, 65535, 65536, 262160]
+        for count in range(1, 21):
+            chunks = [os.urandom(sizes[i % len(sizes)]) for i in range(count)]
+            for file_id, seq in ((0, 0), (7, 127), (300, 70000), (2 ** 40, 2 ** 33)):
+                with self.subTest(count=count, file_id=file_id, seq=seq):
+                    parts = self.node._frame_file_batch(file_id, seq, chunks)
+                    self.assertEqual(b''.join(parts), self._expected(file_id, seq, chunks))
+
+    def test_chunks_are_not_copied(self):
+        chunks = [os.urandom(1000), os.urandom(2000)]
+        parts = self.node._frame_file_batch(1, 0, chunks)
+        self.assertTrue(any(part is chunks[0] for part in parts))
+        self.assertTrue(any(part is chunks[1] for part in parts))
+
+    def test_frame_is_decoded_by_receiver(self):
+        chunks = [b'a' * 10, memoryview(b'b' * 300)]
+        frame = b''.join(self.node._frame_file_batch(3, 8, chunks))
+        self.assertEqual(P2PNode.loads(frame), {
+            'type': MessageType.FILE_BATCH.value,
+            'payload': {'file_id': 3, 'seq': 8, 'chunks': [b'a' * 10, b'b' * 300]}
+        })
+
+
+if __name__ == '__main__':
+    unittest.main()
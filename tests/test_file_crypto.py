@@ -0,0 +1,75 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.exceptions import InvalidTag
+
+from crypto import AEAD_AESGCM, AEAD_CHACHA, AEAD_TAG_SIZE, CryptoManager
+
+
+class FileCryptoTest(unittest.TestCase):
+    # Enkripsi file per chunk (FileEncryptor) dan decrypt_file, untuk kedua AEAD
+    def _pair(self, alg):
+        # Dua CryptoManager yang sudah bertukar public key dengan AEAD yang sama
+        alice, bob = CryptoManager(), CryptoManager()
+        alice.aead_alg = bob.aead_alg = alg
+        alice.import_peer_public_key('bob', bob.get_public_key_bytes(), alg)
+        bob.import_peer_public_key('alice', alice.get_public_key_bytes(), alg)
+        return alice, bob
+
+    def _encrypt(self, sender, chunks):
+        encrypted = sender.encrypt_file(chunks, 'bob')
+        return list(encrypted['encrypted_file']), encrypted['nonce']
+
+    def _decrypt(self, receiver, ciphertexts, nonce, buffer=None):
+        encrypted_data = {'encrypted_file': ciphertexts, 'nonce': nonce}
+        return b''.join(bytes(chunk) for chunk in receiver.decrypt_file(encrypted_data, 'alice', buffer))
+
+    def test_round_trip(self):
+        chunks = [os.urandom(1000), os.urandom(1000), os.urandom(17)]
+        for alg in (AEAD_CHACHA, AEAD_AESGCM):
+            with self.subTest(alg=alg):
+                alice, bob = self._pair(alg)
+                ciphertexts, nonce = self._encrypt(alice, chunks)
+                self.assertEqual([len(c) for c in ciphertexts], [len(c) + AEAD_TAG_SIZE for c in chunks])
+                self.assertEqual(self._decrypt(bob, ciphertexts, nonce), b''.join(chunks))
+                self.assertEqual(self._decrypt(bob, ciphertexts, nonce, bytearray(1000)), b''.join(chunks))
+
+    def test_empty_file_is_one_chunk(self):
+        alice, bob = self._pair(AEAD_CHACHA)
+        ciphertexts, nonce = self._encrypt(alice, [])
+        self.assertEqual(len(ciphertexts), 1)
+        self.assertEqual(self._decrypt(bob, ciphertexts, nonce), b'')
+
+    def test_truncated_file_is_rejected(self):
+        alice, bob = self._pair(AEAD_CHACHA)
+        ciphertexts, nonce = self._encrypt(alice, [b'a' * 10, b'b' * 10, b'c' * 10])
+        with self.assertRaisesRegex(ValueError, 'terpotong'):
+            self._decrypt(bob, ciphertexts[:2], nonce)
+
+    def test_reordered_chunks_are_rejected(self):
+        alice, bob = self._pair(AEAD_CHACHA)
+        ciphertexts, nonce = self._encrypt(alice, [b'a' * 10, b'b' * 10, b'c' * 10])
+        with self.assertRaises((ValueError, InvalidTag)):
+            self._decrypt(bob, [ciphertexts[1], ciphertexts[0], ciphertexts[2]], nonce)
+        with self.assertRaises((ValueError, InvalidTag)):
+            self._decrypt(bob, [ciphertexts[0], ciphertexts[2], ciphertexts[1]], nonce)
+
+    def test_data_after_last_chunk_is_rejected(self):
+        alice, bob = self._pair(AEAD_CHACHA)
+        ciphertexts, nonce = self._encrypt(alice, [b'a' * 10, b'b' * 10])
+        with self.assertRaisesRegex(ValueError, 'setelah chunk terakhir'):
+            self._decrypt(bob, ciphertexts + [ciphertexts[0]], nonce)
+
+    def test_wrong_peer_key_is_rejected(self):
+        alice, bob = self._pair(AEAD_CHACHA)
+        _, eve = self._pair(AEAD_CHACHA)
+        ciphertexts, nonce = self._encrypt(alice, [b'secret'])
+        with self.assertRaises(ValueError):
+            self._decrypt(eve, ciphertexts, nonce)
+
+
+if __name__ == '__main__':
+    unittest.main()
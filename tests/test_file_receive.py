@@ -0,0 +1,49 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crypto import AEAD_TAG_SIZE
+from network import P2PNode
+
+
+class FileReceiveTest(unittest.TestCase):
+    # Penerimaan chunk file langsung lewat handler, tanpa koneksi
+    def setUp(self):
+        self.node = P2PNode('127.0.0.1', 0, 'rx')
+        self.received = []
+        self.node.on_file_received = lambda peer_id, filename, data: self.received.append(data)
+
+    def tearDown(self):
+        for key in list(self.node.receiving_files):
+            self.node._abort_receive(key)
+        for data in self.received:
+            data['encrypted_file'].discard()
+        self.node.sock.close()
+
+    def _start(self, filesize, chunk_count):
+        self.node._handle_file_start('peer', {
+            'file_id': 1, 'filename': '../x.bin', 'filesize': filesize, 'chunk_count': chunk_count, 'nonce': 'n'
+        })
+
+    def test_spooled_size_is_reported(self):
+        self._start(10, 1)
+        self.node._handle_file_chunk('peer', {'file_id': 1, 'seq': 0, 'data': b'a' * (10 + AEAD_TAG_SIZE)})
+        self.node._handle_file_end('peer', {'file_id': 1})
+        self.assertEqual(self.received[0]['size'], 10 + AEAD_TAG_SIZE)
+        self.assertEqual(self.received[0]['filesize'], 10)
+
+    def test_chunks_beyond_announced_size_abort_transfer(self):
+        self._start(10, 1)
+        path = self.node.receiving_files[('peer', 1)]['path']
+        self.node._handle_file_chunk('peer', {'file_id': 1, 'seq': 0, 'data': b'a' * (10 + AEAD_TAG_SIZE)})
+        self.node._handle_file_chunk('peer', {'file_id': 1, 'seq': 1, 'data': b'b'})
+        self.assertNotIn(('peer', 1), self.node.receiving_files)
+        self.assertFalse(os.path.exists(path))
+        self.node._handle_file_end('peer', {'file_id': 1})
+        self.assertEqual(self.received, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
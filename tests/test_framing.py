@@ -0,0 +1,83 @@
+import os
+import socket
+import struct
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from network import FramedConnection, P2PNode
+
+
+class _MainNode:
+    # Pengganti node utama, hanya yang dipakai FramedConnection
+    dumps = P2PNode.dumps
+    loads = P2PNode.loads
+
+    def __init__(self):
+        self.message_count_recv = 0
+        self.messages = []
+        self.disconnected = []
+
+    def debug_print(self, message):
+        pass
+
+    def node_message(self, node, message):
+        self.messages.append(message)
+
+    def node_disconnected(self, node):
+        self.disconnected.append(node)
+
+
+class FramingTest(unittest.TestCase):
+    # Frame [panjang 4 byte][msgpack] lewat socketpair
+    def setUp(self):
+        self.a, self.b = socket.socketpair()
+        self.node = _MainNode()
+        self.sender = FramedConnection(self.node, self.a, 'b', 'local', 0)
+        self.receiver = FramedConnection(self.node, self.b, 'a', 'local', 0)
+        self.receiver.start()
+
+    def tearDown(self):
+        self.receiver.stop()
+        self.a.close()
+        self.receiver.join(5)
+
+    def _wait_for(self, count, timeout=5):
+        deadline = time.monotonic() + timeout
+        while len(self.node.messages) < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return self.node.messages
+
+    def test_dict_frames_round_trip(self):
+        self.sender.send({'type': 'message', 'payload': {'n': 1}})
+        self.sender.send({'type': 'message', 'payload': {'n': 2}})
+        self.assertEqual(self._wait_for(2), [{'type': 'message', 'payload': {'n': 1}},
+                                             {'type': 'message', 'payload': {'n': 2}}])
+
+    def test_large_frame_and_parts_round_trip(self):
+        blob = os.urandom(FramedConnection.SCATTER_MIN * 3)
+        self.sender.send(P2PNode.dumps({'data': blob}))
+        packed = P2PNode.dumps({'parts': True})
+        self.sender.send([packed[:3], packed[3:]])
+        self.assertEqual(self._wait_for(2), [{'data': blob}, {'parts': True}])
+
+    def test_frame_split_across_writes(self):
+        packed = P2PNode.dumps({'split': 'ok'})
+        frame = struct.pack('>I', len(packed)) + packed
+        for i in range(len(frame)):
+            self.a.sendall(frame[i:i + 1])
+            time.sleep(0.001)
+        self.assertEqual(self._wait_for(1), [{'split': 'ok'}])
+
+    def test_oversized_frame_terminates_connection(self):
+        self.a.sendall(struct.pack('>I', FramedConnection.MAX_FRAME + 1) + b'x' * 16)
+        self.receiver.join(5)
+        self.assertFalse(self.receiver.is_alive())
+        self.assertEqual(self.node.disconnected, [self.receiver])
+        self.assertEqual(self.node.messages, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from network import P2PNode, Group
+
+
+class GroupRelayTest(unittest.TestCase):
+    # Fan-out pesan group lewat loopback: member langsung dan member yang hanya terjangkau lewat relay
+    def setUp(self):
+        self.nodes = {}
+        self.got = {}
+
+    def tearDown(self):
+        for node in self.nodes.values():
+            node.stop()
+
+    def _start(self, names):
+        # Jalankan node di port bebas, catat pesan group yang diterima per node
+        for name in names:
+            node = P2PNode('127.0.0.1', 0, name)
+            node.port = node.sock.getsockname()[1]
+            self.got[name] = []
+            node.on_group_message_received = (lambda name: lambda frm, p: self.got[name].append(p['encrypted']))(name)
+            node.start()
+            self.nodes[name] = node
+
+    def _connect(self, edges):
+        # Sambungkan pasangan node lalu tunggu handshake kedua arah
+        for a, b in edges:
+            self.nodes[a].connect_to_peer('127.0.0.1', self.nodes[b].port)
+        self._wait(lambda: all(
+            self.nodes[b].id in self.nodes[a].peer_usernames and self.nodes[a].id in self.nodes[b].peer_usernames
+            for a, b in edges
+        ))
+
+    def _group(self, names):
+        # Pasang group yang sama di semua node (seperti setelah invite)
+        members = [self.nodes[name].id for name in names]
+        for name in names:
+            self.nodes[name].groups['g'] = Group('g', 'g', members[0], list(members), id_table=tuple(members))
+
+    def _wait(self, cond, timeout=5):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if cond():
+                return True
+            time.sleep(0.05)
+        return cond()
+
+    def test_star_hub_reaches_every_leaf(self):
+        self._start(['A', 'B', 'C', 'D'])
+        self._connect([('A', 'B'), ('A', 'C'), ('A', 'D')])
+        self._group(['A', 'B', 'C', 'D'])
+        self.nodes['A'].send_group_message('g', 'hello from hub', 'A')
+        self._wait(lambda: all(self.got[name] for name in 'BCD'))
+        self.assertEqual(self.got, {'A': [], 'B': ['hello from hub'], 'C': ['hello from hub'], 'D': ['hello from hub']})
+
+    def test_unconnected_member_is_relayed_once(self):
+        # A tidak terhubung ke C, pesan sampai lewat B
+        self._start(['A', 'B', 'C'])
+        self._connect([('A', 'B'), ('B', 'C')])
+        self._group(['A', 'B', 'C'])
+        self.nodes['A'].send_group_message('g', 'via relay', 'A')
+        self._wait(lambda: self.got['B'] and self.got['C'])
+        time.sleep(0.2)
+        self.assertEqual(self.got['B'], ['via relay'])
+        self.assertEqual(self.got['C'], ['via relay'])
+
+    def test_failed_relay_is_retried_through_another_head(self):
+        # Head pertama (B) tidak kenal D, laporannya membuat A mencoba lewat C
+        self._start(['A', 'B', 'C', 'D'])
+        self._connect([('A', 'B'), ('A', 'C'), ('C', 'D')])
+        self._group(['A', 'B', 'C', 'D'])
+        self.nodes['A'].GROUP_FANOUT = 1
+        self.nodes['A'].send_group_message('g', 'retry', 'A')
+        self._wait(lambda: all(self.got[name] for name in 'BCD'))
+        self.assertEqual(self.got, {'A': [], 'B': ['retry'], 'C': ['retry'], 'D': ['retry']})
+
+    def test_sender_uploads_only_to_heads_when_heads_reach_everyone(self):
+        # B dan C terhubung ke semua member lain, A cukup mengirim GROUP_FANOUT frame
+        self._start(['A', 'B', 'C', 'D', 'E'])
+        self._connect([('A', 'B'), ('A', 'C'), ('A', 'D'), ('A', 'E'), ('B', 'D'), ('B', 'E'), ('C', 'D'), ('C', 'E')])
+        self._group(['A', 'B', 'C', 'D', 'E'])
+        a = self.nodes['A']
+        sent = a.message_count_send
+        a.send_group_message('g', 'cheap', 'A')
+        self._wait(lambda: all(self.got[name] for name in 'BCDE'))
+        time.sleep(0.2)
+        self.assertEqual(a.message_count_send - sent, a.GROUP_FANOUT)
+        self.assertEqual([self.got[name] for name in 'BCDE'], [['cheap']] * 4)
+
+    def test_relay_bits_unknown_to_head_are_returned(self):
+        # B belum punya group (invite belum sampai), bitmap titipan dikembalikan dan A mengirim langsung ke C
+        self._start(['A', 'B', 'C'])
+        self._connect([('A', 'B'), ('A', 'C')])
+        self._group(['A', 'B', 'C'])
+        del self.nodes['B'].groups['g']
+        self.nodes['A'].GROUP_FANOUT = 1
+        self.nodes['A'].send_group_message('g', 'bits', 'A')
+        self._wait(lambda: self.got['B'] and self.got['C'])
+        self.assertEqual(self.got['C'], ['bits'])
+
+    def test_relay_from_non_member_is_ignored(self):
+        # X bukan member group, titipan relay-nya ke C tidak boleh diteruskan oleh B
+        self._start(['A', 'B', 'C', 'X'])
+        self._connect([('A', 'B'), ('B', 'C'), ('X', 'B')])
+        self._group(['A', 'B', 'C'])
+        x, b = self.nodes['X'], self.nodes['B']
+        x._send_raw(x.get_node_by_id(b.id), x._frame('group_message', {
+            'msg_id': 'spoof', 'group_id': 'g', 'sender': 'X', 'encrypted': 'spam', 'relay': [self.nodes['C'].id]
+        }))
+        self._wait(lambda: self.got['B'])
+        time.sleep(0.3)
+        self.assertEqual(self.got['B'], ['spam'])
+        self.assertEqual(self.got['C'], [])
+
+
+if __name__ == '__main__':
+    unittest.main()